@@ -0,0 +1,56 @@
+"""add ticket holds
+
+Revision ID: 0007_add_ticket_holds
+Revises: 0006_add_idempotency_keys
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_add_ticket_holds"
+down_revision: Union[str, Sequence[str], None] = "0006_add_idempotency_keys"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(inspector, table: str, column: str) -> bool:
+    try:
+        return any(c.get("name") == column for c in inspector.get_columns(table))
+    except Exception:
+        return False
+
+
+def _has_index(inspector, table: str, index_name: str) -> bool:
+    try:
+        return any(ix.get("name") == index_name for ix in inspector.get_indexes(table))
+    except Exception:
+        return False
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not _has_column(inspector, "tickets", "hold_until"):
+        op.add_column("tickets", sa.Column("hold_until", sa.DateTime(), nullable=True))
+    if not _has_column(inspector, "events", "hold_duration_minutes"):
+        op.add_column("events", sa.Column("hold_duration_minutes", sa.Integer(), nullable=True))
+    if not _has_index(inspector, "tickets", "ix_tickets_status_hold_until"):
+        op.create_index(
+            "ix_tickets_status_hold_until",
+            "tickets",
+            ["status", "hold_until"],
+            unique=False,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_tickets_status_hold_until", table_name="tickets")
+    with op.batch_alter_table("events") as batch_op:
+        batch_op.drop_column("hold_duration_minutes")
+    with op.batch_alter_table("tickets") as batch_op:
+        batch_op.drop_column("hold_until")
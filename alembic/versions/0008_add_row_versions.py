@@ -0,0 +1,74 @@
+"""add row versions
+
+Revision ID: 0008_add_row_versions
+Revises: 0007_add_ticket_holds
+Create Date: 2026-10-19
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_add_row_versions"
+down_revision: Union[str, Sequence[str], None] = "0007_add_ticket_holds"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Table and the column used as the first `updated_at` of existing rows
+VERSIONED_TABLES = {
+    "users": None,
+    "events": None,
+    "ticket_groups": None,
+    "tickets": "order_date",
+}
+
+
+def _has_column(inspector, table: str, column: str) -> bool:
+    try:
+        return any(c.get("name") == column for c in inspector.get_columns(table))
+    except Exception:
+        return False
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    now = datetime.now()
+    for table, source in VERSIONED_TABLES.items():
+        if not _has_column(inspector, table, "version"):
+            op.add_column(table, sa.Column(
+                "version", sa.Integer(), nullable=False, server_default="1"))
+        if not _has_column(inspector, table, "updated_at"):
+            op.add_column(table, sa.Column(
+                "updated_at", sa.DateTime(), nullable=True))
+
+        # Backfill existing rows by the local time like ORM does, NOW() of
+        # SQLite is in UTC
+        backfill = sa.literal(now, sa.DateTime())
+        if source is not None:
+            backfill = sa.func.coalesce(sa.column(source), backfill)
+        op.execute(
+            sa.table(table, sa.column("updated_at"))
+            .update()
+            .where(sa.column("updated_at").is_(None))
+            .values(updated_at=backfill)
+        )
+
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                "updated_at",
+                existing_type=sa.DateTime(),
+                nullable=False,
+                server_default=sa.func.now(),
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in VERSIONED_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("updated_at")
+            batch_op.drop_column("version")
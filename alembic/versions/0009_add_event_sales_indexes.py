@@ -0,0 +1,49 @@
+"""add event sales indexes
+
+Revision ID: 0009_add_event_sales_indexes
+Revises: 0008_add_row_versions
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_add_event_sales_indexes"
+down_revision: Union[str, Sequence[str], None] = "0008_add_row_versions"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_index(inspector, table: str, index_name: str) -> bool:
+    try:
+        return any(ix.get("name") == index_name for ix in inspector.get_indexes(table))
+    except Exception:
+        return False
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not _has_index(inspector, "events", "ix_events_sales_start_end"):
+        op.create_index(
+            "ix_events_sales_start_end",
+            "events",
+            ["tickets_sales_start", "tickets_sales_end"],
+            unique=False,
+        )
+    if not _has_index(inspector, "events", "ix_events_sales_end_start"):
+        op.create_index(
+            "ix_events_sales_end_start",
+            "events",
+            ["tickets_sales_end", "tickets_sales_start"],
+            unique=False,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_events_sales_end_start", table_name="events")
+    op.drop_index("ix_events_sales_start_end", table_name="events")
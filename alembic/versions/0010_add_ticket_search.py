@@ -0,0 +1,85 @@
+"""add ticket search
+
+Revision ID: 0010_add_ticket_search
+Revises: 0009_add_event_sales_indexes
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0010_add_ticket_search"
+down_revision: Union[str, Sequence[str], None] = "0009_add_event_sales_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# SQLite full-text table and triggers keeping it in sync with tickets
+SQLITE_UPGRADE = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(
+        email, firstname, lastname, description,
+        content='tickets', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_insert AFTER INSERT ON tickets BEGIN
+        INSERT INTO tickets_fts(rowid, email, firstname, lastname, description)
+        VALUES (new.id, new.email, new.firstname, new.lastname, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_delete AFTER DELETE ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, email, firstname, lastname, description)
+        VALUES ('delete', old.id, old.email, old.firstname, old.lastname, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_update
+    AFTER UPDATE OF email, firstname, lastname, description ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, email, firstname, lastname, description)
+        VALUES ('delete', old.id, old.email, old.firstname, old.lastname, old.description);
+        INSERT INTO tickets_fts(rowid, email, firstname, lastname, description)
+        VALUES (new.id, new.email, new.firstname, new.lastname, new.description);
+    END""",
+    # Index existing tickets
+    "INSERT INTO tickets_fts(tickets_fts) VALUES ('rebuild')",
+)
+SQLITE_DOWNGRADE = (
+    "DROP TRIGGER IF EXISTS tickets_fts_update",
+    "DROP TRIGGER IF EXISTS tickets_fts_delete",
+    "DROP TRIGGER IF EXISTS tickets_fts_insert",
+    "DROP TABLE IF EXISTS tickets_fts",
+)
+SEARCH_COLUMNS = ["email", "firstname", "lastname", "description"]
+
+
+def _has_index(inspector, table: str, index_name: str) -> bool:
+    try:
+        return any(ix.get("name") == index_name for ix in inspector.get_indexes(table))
+    except Exception:
+        return False
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+    elif bind.dialect.name in ("mysql", "mariadb"):
+        inspector = sa.inspect(bind)
+        if not _has_index(inspector, "tickets", "ix_tickets_search"):
+            op.create_index(
+                "ix_tickets_search",
+                "tickets",
+                SEARCH_COLUMNS,
+                mysql_prefix="FULLTEXT",
+                mariadb_prefix="FULLTEXT",
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
+    elif bind.dialect.name in ("mysql", "mariadb"):
+        op.drop_index("ix_tickets_search", table_name="tickets")
@@ -1,6 +1,6 @@
-from sqlalchemy import create_engine  # , MetaData
+from sqlalchemy import create_engine, inspect, select  # , MetaData
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session  # , Mapped
-from typing import Any
+from typing import Any, Iterator
 from app.schemas.settings import settings
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
@@ -84,6 +84,28 @@ class BaseModelMixin(DeclarativeBase):
         except Exception:
             return db_session.query(cls).limit(limit).all()
 
+    @classmethod
+    def iter_batches(cls, db_session: Session, batch_size: int, *options: Any) -> Iterator[list]:
+        """
+        @brief Iterates all objects in batches ordered by primary key
+        Every batch is one query continuing after the last key of previous
+        batch, so only one batch is in memory and no cursor is left open
+        while related objects of the batch are loaded.
+        @param session The session
+        @param batch_size count of objects in one batch
+        @param options loader options, e.g. `selectinload(...)`
+        @return Iterator of lists of objects
+        """
+        key = inspect(cls).primary_key[0]
+        stmt = select(cls).options(*options).order_by(key).limit(batch_size)
+        batch = db_session.scalars(stmt).all()
+        while batch:
+            yield batch
+            if len(batch) < batch_size:
+                return
+            last = getattr(batch[-1], key.key)
+            batch = db_session.scalars(stmt.where(key > last)).all()
+
     @classmethod
     def get_count(cls, db_session: Session) -> int:
         """
@@ -0,0 +1,89 @@
+"""Module for conditional HTTP requests"""
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from hashlib import blake2b
+from typing import Any
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import inspect
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Method for checking `If-None-Match` header against current ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison is used for If-None-Match (RFC 9110, section 13.1.2)
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in tags
+
+
+def not_modified(etag: str, headers: dict[str, str] | None = None) -> Response:
+    """Method for empty `304 Not Modified` response"""
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, **(headers or {})},
+    )
+
+
+def version_etag(*rows: Any) -> str:
+    """
+    Method for ETag of a resource from versions of all its database rows
+    @param rows ORM objects with `version` column included in the response
+    """
+    key = ",".join(
+        f"{type(row).__name__}:{inspect(row).identity}:{row.version}"
+        for row in rows
+    )
+    return f'"v-{blake2b(key.encode(), digest_size=12).hexdigest()}"'
+
+
+def version_headers(*rows: Any) -> dict[str, str]:
+    """Method for `ETag` and `Last-Modified` headers of versioned rows"""
+    updated_at = max(row.updated_at for row in rows)
+    return {
+        "ETag": version_etag(*rows),
+        # Naive datetimes in database are in local time
+        "Last-Modified": format_datetime(
+            updated_at.astimezone(timezone.utc), usegmt=True),
+    }
+
+
+def is_not_modified(request: Request, headers: dict[str, str]) -> bool:
+    """
+    Method for evaluating `If-None-Match` or `If-Modified-Since` header
+    @param headers response headers from `version_headers`
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, headers["ETag"])
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return parsedate_to_datetime(headers["Last-Modified"]) <= since
+
+
+def check_if_match(if_match: str | None, etag: str):
+    """
+    Method for optimistic concurrency, raises 412 when the resource was
+    changed since the client read it
+    """
+    if not if_match or if_match.strip() == "*":
+        return
+    # Weak tags are accepted, compressed responses weaken the same version
+    tags = [tag.strip().removeprefix("W/") for tag in if_match.split(",")]
+    if etag not in tags:
+        raise precondition_failed()
+
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Resource was changed meanwhile, read it again.",
+    )
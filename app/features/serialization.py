@@ -0,0 +1,79 @@
+"""
+Module for fast JSON responses
+
+Returning ORM objects lets FastAPI validate them against `response_model`
+and encode the result afterwards. Routes returning large lists use a type
+adapter compiled once per schema instead, objects are validated once and
+dumped straight to JSON bytes. Unbounded lists can be streamed as JSON
+arrays encoded batch by batch.
+"""
+from functools import cache
+from typing import Any, Iterable, Iterator
+import orjson
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+
+
+class ORJSONResponse(Response):
+    """Response for plain data (dictionaries, lists, datetimes) encoded by orjson"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+@cache
+def get_adapter(schema: Any) -> TypeAdapter:
+    """Returns type adapter for the schema, it's built only once"""
+    return TypeAdapter(schema)
+
+
+def dump_json(schema: Any, content: Any) -> bytes:
+    """
+    @brief Validates ORM objects against the schema and dumps them to JSON
+    @param schema response schema, e.g. `list[Ticket]`
+    @param content ORM objects or data matching the schema
+    @return JSON bytes
+    """
+    adapter = get_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+
+def schema_response(schema: Any, content: Any, **kwargs) -> Response:
+    """Method for JSON response of ORM objects serialized by the schema"""
+    return Response(
+        content=dump_json(schema, content),
+        media_type="application/json",
+        **kwargs,
+    )
+
+
+def iter_json_array(batches: Iterable[list], schema: Any = None) -> Iterator[bytes]:
+    """
+    @brief Encodes batches of items as one JSON array, batch by batch
+    @param batches lists of items, e.g. ORM objects loaded in batches
+    @param schema schema of one item, plain data are encoded by orjson without it
+    @return Iterator of JSON chunks
+    """
+    yield b"["
+    separator = b""
+    for batch in batches:
+        if not batch:
+            continue
+        if schema is None:
+            body = orjson.dumps(batch, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            body = dump_json(list[schema], batch)
+        # Elements of the batch without brackets of its array
+        yield separator + body[1:-1]
+        separator = b","
+    yield b"]"
+
+
+def stream_response(batches: Iterable[list], schema: Any = None) -> StreamingResponse:
+    """Method for JSON array response streamed from batches of items"""
+    return StreamingResponse(
+        iter_json_array(batches, schema),
+        media_type="application/json",
+    )
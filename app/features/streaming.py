@@ -0,0 +1,106 @@
+"""
+Module for streaming files produced by blocking writers
+
+Libraries like openpyxl write a whole file into a file object. The writer
+runs in its own thread and written bytes are passed to the response in
+chunks through a bounded queue, so the file is never kept whole in memory
+and a slow client slows the writer down.
+"""
+import queue
+import threading
+from typing import BinaryIO, Callable, Iterator
+
+CHUNK_SIZE = 64 * 1024
+MAX_QUEUED_CHUNKS = 16
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """Client stopped reading the response"""
+
+
+class _QueueWriter:
+    """
+    Write-only, unseekable file object putting chunks to the queue
+    `zipfile` writes data descriptors for unseekable files, so ZIP based
+    formats (XLSX) can be streamed too.
+    """
+
+    closed = False
+
+    def __init__(self, chunks: queue.Queue, stopped: threading.Event):
+        self._chunks = chunks
+        self._stopped = stopped
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        # Arrow writers need count of written bytes
+        return self._position
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self._position += len(data)
+        if len(self._buffer) >= CHUNK_SIZE:
+            self.put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        if self._buffer:
+            self.put(bytes(self._buffer))
+            self._buffer.clear()
+        self.put(_DONE)
+
+    def put(self, item: object):
+        while True:
+            if self._stopped.is_set():
+                raise _Stopped()
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+
+def iter_written(write: Callable[[BinaryIO], None]) -> Iterator[bytes]:
+    """
+    @brief Runs the writer in a thread and yields written bytes
+    @param write function writing the whole file into given file object
+    @return Iterator of chunks for `StreamingResponse`
+    """
+    chunks: queue.Queue = queue.Queue(maxsize=MAX_QUEUED_CHUNKS)
+    stopped = threading.Event()
+    out = _QueueWriter(chunks, stopped)
+
+    def produce():
+        try:
+            write(out)
+            out.finish()
+        except _Stopped:
+            pass
+        except Exception as e:
+            try:
+                out.put(e)
+            except _Stopped:
+                pass
+
+    threading.Thread(target=produce, name="file-writer", daemon=True).start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Writer stops on its next write when the client is gone
+        stopped.set()
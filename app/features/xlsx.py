@@ -0,0 +1,110 @@
+"""
+Module for XLSX layouts parsed from template workbooks
+
+Template worksheet is parsed once into a blueprint holding values, styles,
+dimensions and page settings. The blueprint is applied to write-only
+worksheets, so templates are not loaded nor copied on every export.
+"""
+from copy import copy
+from typing import Any
+from openpyxl import load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.styleable import StyleableObject
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+
+STYLE_ATTRIBUTES = ("font", "border", "fill", "number_format", "protection", "alignment")
+
+
+def get_style(obj: StyleableObject) -> dict[str, Any] | None:
+    """
+    Method for reading style of a cell or dimension
+    Styles are stored as indexes to the workbook, so they can be moved to
+    other workbook only as style objects.
+    """
+    if not obj.has_style:
+        return None
+    return {name: copy(getattr(obj, name)) for name in STYLE_ATTRIBUTES}
+
+
+def set_style(obj: StyleableObject, style: dict[str, Any] | None):
+    obj._style = StyleArray()
+    if style is not None:
+        for name, value in style.items():
+            setattr(obj, name, value)
+
+
+class CellBlueprint:
+    """Value and style of one template cell"""
+
+    def __init__(self, cell):
+        self.value = cell.value
+        self.style = get_style(cell)
+
+    def create(self, ws: WriteOnlyWorksheet, value: Any = None) -> WriteOnlyCell:
+        cell = WriteOnlyCell(ws, value=value)
+        set_style(cell, self.style)
+        return cell
+
+
+class SheetBlueprint:
+    """Layout of a template worksheet"""
+
+    def __init__(self, filename: str, sheet_name: str):
+        wb = load_workbook(filename=filename)
+        ws = wb[sheet_name]
+        self.rows = [
+            [CellBlueprint(cell) for cell in row]
+            for row in ws.iter_rows()
+        ]
+        self.column_dimensions = {
+            key: (copy(dim), get_style(dim)) for key, dim in ws.column_dimensions.items()
+        }
+        self.row_dimensions = {
+            key: (copy(dim), get_style(dim)) for key, dim in ws.row_dimensions.items()
+        }
+        self.merged_cells = copy(ws.merged_cells)
+        self.sheet_format = copy(ws.sheet_format)
+        self.sheet_properties = copy(ws.sheet_properties)
+        self.page_margins = copy(ws.page_margins)
+        self.page_setup = copy(ws.page_setup)
+        self.print_options = copy(ws.print_options)
+        wb.close()
+
+    def create_sheet(self, wb, title: str) -> WriteOnlyWorksheet:
+        """
+        Creates write-only worksheet with dimensions and page settings of
+        the template, rows have to be appended by `append_row`
+        """
+        ws = wb.create_sheet(title=title)
+        # Dimensions are bound to the new worksheet, their style ids are
+        # registered in its workbook
+        for attr in ("row_dimensions", "column_dimensions"):
+            target = getattr(ws, attr)
+            for key, (dim, style) in getattr(self, attr).items():
+                target[key] = copy(dim)
+                target[key].parent = ws
+                set_style(target[key], style)
+        ws.merged_cells = copy(self.merged_cells)
+        ws.sheet_format = copy(self.sheet_format)
+        ws.sheet_properties = copy(self.sheet_properties)
+        ws.page_margins = copy(self.page_margins)
+        ws.page_setup = copy(self.page_setup)
+        ws.print_options = copy(self.print_options)
+        return ws
+
+    def append_row(self, ws: WriteOnlyWorksheet, row_number: int, values: dict[int, Any] | None = None):
+        """
+        Appends the row in the template layout
+        @param row_number number of the row (from 1), rows behind the template are not styled
+        @param values values replacing the template ones by column number (from 1)
+        """
+        values = values or {}
+        if row_number > len(self.rows):
+            last = max(values, default=0)
+            ws.append([values.get(column) for column in range(1, last + 1)])
+            return
+        ws.append([
+            cell.create(ws, values.get(column, cell.value))
+            for column, cell in enumerate(self.rows[row_number - 1], 1)
+        ])
@@ -1,8 +1,9 @@
 """Main module of Cute Tickets project"""
+import asyncio
 from datetime import datetime
 import sys
 from app.features.git import Git
-from app.routers import events, ticket_groups, tickets, auth, users
+from app.routers import events, exports, ticket_groups, tickets, auth, users
 from app.schemas.root import RootResponse
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
@@ -11,6 +12,10 @@ import logging
 from app.schemas.settings import settings
 import app.models  # Important for table registrations
 from app.database import engine, BaseModelMixin
+from app.middleware.compression import CompressionMiddleware
+from app.services import event as event_service
+from app.services import export_jobs
+from app.services.sweeper import run_sweeper
 
 
 class HealthCheckFilter(logging.Filter):
@@ -25,9 +30,13 @@ logging.getLogger("uvicorn.access").addFilter(HealthCheckFilter())
 async def lifespan(app: FastAPI):
     # startup block
     BaseModelMixin.metadata.create_all(bind=engine)
+    event_service.get_libor_blueprint()
+    sweeper = asyncio.create_task(run_sweeper())
 
     yield
     # shutdown block
+    sweeper.cancel()
+    export_jobs.shutdown()
 
 app = FastAPI(
     swagger_ui_parameters={
@@ -55,6 +64,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_minimum_size,
+)
 
 
 @app.get("/", response_model=RootResponse)
@@ -77,6 +90,7 @@ def health_check():
 
 app.include_router(auth.router)
 app.include_router(events.router)
+app.include_router(exports.router)
 app.include_router(ticket_groups.router)
 app.include_router(tickets.router)
 app.include_router(users.router)
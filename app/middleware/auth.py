@@ -6,33 +6,40 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
 
 from app.schemas.auth import AuthTokenData
-from app.schemas.user import UserFromDB
+from app.schemas.user import AuthPrincipal
 from app.database import get_db
-from app.services.user import get_by_username
+from app.services.user import get_principal
 from app.schemas.settings import settings
 
+SCOPES = {
+    "users:read": "Read information about users.",
+    "users:edit": "Edit information about users.",
+    "events:read": "Read information about events.",
+    "events:edit": "Edit information about events.",
+    "token_family:read": "Read all token families from DB",
+    "ticket_groups:read": "Read information about ticket groups.",
+    "ticket_groups:edit": "Edit information about ticket groups.",
+    "tickets:read": "Read information about tickets.",
+    "tickets:edit": "Edit information about tickets.",
+}
+
+
+def get_unknown_scopes(scopes: list[str]) -> list[str]:
+    """Returns scopes which can't be granted, in the given order"""
+    return [scope for scope in scopes if scope not in SCOPES]
+
 # https://fastapi.tiangolo.com/advanced/security/oauth2-scopes/
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="/auth/login",
     refreshUrl="/auth/refresh",
-    scopes={
-        "users:read": "Read information about users.",
-        "users:edit": "Edit information about users.",
-        "events:read": "Read information about events.",
-        "events:edit": "Edit information about events.",
-        "token_family:read": "Read all token families from DB",
-        "ticket_groups:read": "Read information about ticket groups.",
-        "ticket_groups:edit": "Edit information about ticket groups.",
-        "tickets:read": "Read information about tickets.",
-        "tickets:edit": "Edit information about tickets.",
-    },
+    scopes=SCOPES,
 )
 
 
 async def get_current_user(
     security_scopes: SecurityScopes, token: Annotated[str, Depends(oauth2_scheme)],
     db: Session = Depends(get_db),
-):
+) -> AuthPrincipal:
     if security_scopes.scopes:
         authenticate_value = f'Bearer scope="{security_scopes.scope_str}"'
     else:
@@ -59,7 +66,7 @@ async def get_current_user(
         token_data = AuthTokenData(scopes=token_scopes, username=username)
     except (InvalidTokenError, ValidationError):
         raise credentials_exception
-    user = get_by_username(token_data.username, db=db)
+    user = get_principal(token_data.username, db=db)
     if user is None:
         raise credentials_exception
     for scope in security_scopes.scopes:
@@ -73,8 +80,8 @@ async def get_current_user(
 
 
 async def get_current_active_user(
-    current_user: Annotated[UserFromDB, Depends(get_current_user)],
-):
+    current_user: Annotated[AuthPrincipal, Depends(get_current_user)],
+) -> AuthPrincipal:
     if current_user.disabled:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -0,0 +1,120 @@
+"""
+Module for compression of responses
+
+Bodies are compressed by gzip or brotli chosen by `Accept-Encoding` header.
+Small bodies, already encoded responses (e.g. the prebuilt catalog), event
+streams and already compressed file formats are sent unchanged.
+"""
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.features.compression import StreamCompressor, compress, negotiate_encoding
+
+# Formats which are compressed already, XLSX is a zip archive
+UNCOMPRESSIBLE_TYPES = (
+    "application/vnd.openxmlformats-officedocument.",
+    "application/zip",
+    "application/gzip",
+    "application/vnd.apache.parquet",
+    "image/",
+    "audio/",
+    "video/",
+)
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "")
+    # Compressor would delay events until its buffer is full
+    if content_type.startswith("text/event-stream"):
+        return False
+    return not content_type.startswith(UNCOMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses bigger than `minimum_size`
+    Bodies sent in one message are compressed at once, streamed bodies
+    are compressed chunk by chunk.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressedResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send
+        self.start: Message | None = None
+        self.compressor: StreamCompressor | None = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message):
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            # Sending is postponed until the first part of the body
+            self.start = message
+            if not is_compressible(Headers(raw=message["headers"])):
+                self.passthrough = True
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if not more_body:
+                # Whole body is known, compress it only when it pays off
+                if len(body) >= self.minimum_size:
+                    body = compress(body, self.encoding)
+                    self._set_headers(len(body))
+                await self.send(self.start)
+                await self.send({**message, "body": body})
+                return
+            self.compressor = StreamCompressor(self.encoding)
+            self._set_headers(None)
+            await self.send(self.start)
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.flush()
+        if chunk or not more_body:
+            await self.send({**message, "body": chunk})
+
+    def _set_headers(self, content_length: int | None):
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        # Compressed body is equivalent, not byte equal (like nginx does)
+        etag = headers.get("ETag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
@@ -1,6 +1,7 @@
+from datetime import datetime
 from uuid_extensions import uuid7
-from sqlalchemy import DateTime, Integer, String, ForeignKey, Enum, JSON, BINARY, Table, Column
-from sqlalchemy.orm import Mapped, relationship, mapped_column
+from sqlalchemy import DDL, DateTime, Integer, String, ForeignKey, Enum, JSON, BINARY, Table, Column, Index, event, func
+from sqlalchemy.orm import Mapped, declared_attr, relationship, mapped_column
 from enum import Enum as pythonEnum
 from app.database import BaseModelMixin
 
@@ -9,6 +10,28 @@ def generate_uuid() -> bytes:
     return uuid7(as_type="bytes")
 
 
+class VersionedMixin:
+    """
+    Row version for conditional requests and optimistic concurrency
+    ORM updates increase `version` and check it in WHERE clause (raising
+    `StaleDataError` for concurrent change), bulk updates must increase it
+    on their own.
+    """
+    version: Mapped[int] = mapped_column(
+        Integer, nullable=False, server_default="1")
+    updated_at: Mapped[DateTime] = mapped_column(
+        DateTime,
+        nullable=False,
+        default=datetime.now,
+        onupdate=datetime.now,
+        server_default=func.now(),
+    )
+
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict:
+        return {"version_id_col": cls.__table__.c.version}
+
+
 user_favorite_events = Table(
     "user_favorite_events",
     BaseModelMixin.metadata,
@@ -19,7 +42,7 @@ user_favorite_events = Table(
 )
 
 
-class User(BaseModelMixin):
+class User(VersionedMixin, BaseModelMixin):
     __tablename__ = "users"
 
     uuid: Mapped[str] = mapped_column(
@@ -95,7 +118,7 @@ class TicketStatusEnum(pythonEnum):
     cancelled = 3
 
 
-class Ticket(BaseModelMixin):
+class Ticket(VersionedMixin, BaseModelMixin):
     __tablename__ = "tickets"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
@@ -105,6 +128,8 @@ class Ticket(BaseModelMixin):
     order_date: Mapped[DateTime] = mapped_column(DateTime)
     status: Mapped[TicketStatusEnum] = mapped_column(Enum(TicketStatusEnum))
     description: Mapped[str] = mapped_column(String(length=255), default="")
+    # Unpaid ticket is cancelled automatically after this date
+    hold_until: Mapped[DateTime | None] = mapped_column(DateTime, nullable=True)
     # maybe there should be an attribute for ticket cancellation
 
     # Relationships
@@ -113,8 +138,57 @@ class Ticket(BaseModelMixin):
     )
     group = relationship("TicketGroup", back_populates="tickets")
 
+    __table_args__ = (
+        # Used by sweeper of expired holds
+        Index("ix_tickets_status_hold_until", "status", "hold_until"),
+        # Used by ticket search, SQLite uses `tickets_fts` table instead
+        Index(
+            "ix_tickets_search",
+            "email", "firstname", "lastname", "description",
+            mysql_prefix="FULLTEXT",
+            mariadb_prefix="FULLTEXT",
+        ).ddl_if(dialect=("mysql", "mariadb")),
+    )
+
+
+# Full-text index of tickets for SQLite, triggers keep it in sync with the table
+TICKETS_FTS_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(
+        email, firstname, lastname, description,
+        content='tickets', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_insert AFTER INSERT ON tickets BEGIN
+        INSERT INTO tickets_fts(rowid, email, firstname, lastname, description)
+        VALUES (new.id, new.email, new.firstname, new.lastname, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_delete AFTER DELETE ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, email, firstname, lastname, description)
+        VALUES ('delete', old.id, old.email, old.firstname, old.lastname, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_update
+    AFTER UPDATE OF email, firstname, lastname, description ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, email, firstname, lastname, description)
+        VALUES ('delete', old.id, old.email, old.firstname, old.lastname, old.description);
+        INSERT INTO tickets_fts(rowid, email, firstname, lastname, description)
+        VALUES (new.id, new.email, new.firstname, new.lastname, new.description);
+    END""",
+)
+for statement in TICKETS_FTS_DDL:
+    event.listen(
+        Ticket.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="sqlite"),
+    )
+event.listen(
+    Ticket.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS tickets_fts").execute_if(dialect="sqlite"),
+)
 
-class TicketGroup(BaseModelMixin):
+
+class TicketGroup(VersionedMixin, BaseModelMixin):
     __tablename__ = "ticket_groups"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -129,7 +203,7 @@ class TicketGroup(BaseModelMixin):
     event = relationship("Event", back_populates="ticket_groups")
 
 
-class Event(BaseModelMixin):
+class Event(VersionedMixin, BaseModelMixin):
     __tablename__ = "events"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -137,12 +211,18 @@ class Event(BaseModelMixin):
     tickets_sales_start: Mapped[DateTime] = mapped_column(DateTime)
     tickets_sales_end: Mapped[DateTime] = mapped_column(DateTime)
     smtp_mail_from: Mapped[str] = mapped_column(String(length=255))
-    mail_text_new_ticket: Mapped[str] = mapped_column(String(length=1024))
-    mail_html_new_ticket: Mapped[str] = mapped_column(String(length=2048))
+    # Templates are loaded only when they are used (sending or editing mail)
+    mail_text_new_ticket: Mapped[str] = mapped_column(
+        String(length=1024), deferred=True, deferred_group="mail_templates")
+    mail_html_new_ticket: Mapped[str] = mapped_column(
+        String(length=2048), deferred=True, deferred_group="mail_templates")
     mail_text_cancelled_ticket: Mapped[str] = mapped_column(
-        String(length=1024))
+        String(length=1024), deferred=True, deferred_group="mail_templates")
     mail_html_cancelled_ticket: Mapped[str] = mapped_column(
-        String(length=2048))
+        String(length=2048), deferred=True, deferred_group="mail_templates")
+    # How long new tickets hold capacity before they are paid (None = forever)
+    hold_duration_minutes: Mapped[int | None] = mapped_column(
+        Integer, nullable=True)
 
     # Relationships
     ticket_groups = relationship(
@@ -153,3 +233,21 @@ class Event(BaseModelMixin):
         secondary=user_favorite_events,
         back_populates="favorite_events",
     )
+
+    __table_args__ = (
+        # Range scans of event filters, the first column is the compared one
+        Index("ix_events_sales_start_end", "tickets_sales_start", "tickets_sales_end"),
+        Index("ix_events_sales_end_start", "tickets_sales_end", "tickets_sales_start"),
+    )
+
+
+class IdempotencyKey(BaseModelMixin):
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(String(length=255), primary_key=True)
+    scope: Mapped[str] = mapped_column(String(length=255), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(length=64))
+    # Both are empty while the first request is still in progress
+    status_code: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    response: Mapped[dict | list | None] = mapped_column(JSON, nullable=True)
+    expires_at: Mapped[DateTime] = mapped_column(DateTime, index=True)
@@ -6,9 +6,10 @@ from typing import Annotated
 from fastapi.security import OAuth2PasswordRequestForm
 from app.middleware.auth import get_current_active_user, oauth2_scheme
 from app.schemas.auth import AuthTokenResponse, AuthTokenFamily, AuthRefreshTokenRequest
-from app.schemas.user import UserFromDB, UserLogin, UserRegister
+from app.schemas.user import AuthPrincipal, UserLogin, UserRegister
 from app.schemas.settings import settings
 from app.database import get_db
+from app.features.serialization import stream_response
 import app.services.auth as auth_service
 import app.services.user as user_service
 
@@ -139,7 +140,7 @@ async def get_public_key_file():
     description="Returns list of logged user token families. Requires to be logged in.",
 )
 async def read_users_token_families(
-    current_user: Annotated[UserFromDB, Depends(get_current_active_user)],
+    current_user: Annotated[AuthPrincipal, Depends(get_current_active_user)],
     db: Session = Depends(get_db)
 ):
     return auth_service.get_refresh_token_family_by_user_id(
@@ -156,11 +157,17 @@ async def read_users_token_families(
         scopes=["token_family:read"]
     )],
     summary="Get all refresh token families",
-    description="Returns list of all token families. Requires `token_family:read` scope.",
+    description="Returns list of all token families. With `stream=true` the list is sent in batches as it's read. Requires `token_family:read` scope.",
 )
 async def read_all_refresh_token_families(
+    stream: bool = False,
     db: Session = Depends(get_db),
 ):
+    if stream:
+        return stream_response(
+            auth_service.iter_refresh_token_family_all(settings.list_stream_batch_size),
+            AuthTokenFamily,
+        )
     return auth_service.get_refresh_token_family_all(db)
 
 
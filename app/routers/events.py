@@ -1,13 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Security
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+import asyncio
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status, Security, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session, undefer_group
+from sqlalchemy.orm.exc import StaleDataError
+from datetime import datetime
+from typing import Annotated
 from app import models
+from app.features.compression import negotiate_encoding
+from app.features.http_cache import (
+    check_if_match,
+    etag_matches,
+    is_not_modified,
+    not_modified,
+    precondition_failed,
+    version_etag,
+    version_headers,
+)
+from app.features.serialization import schema_response
 from app.middleware.auth import get_current_active_user
+from app.services import availability, availability_stream
+from app.services import catalog as catalog_service
+from app.schemas.settings import settings
 from app.services import event as event_service
-from app.services import ticket as ticket_service
+from app.services import export_jobs
+from app.services import projection
+from app.services import ticket_export
 from app.schemas import event, extra, ticket, ticket_group
+from app.schemas.export import ExportJobFormatEnum
 from app.database import get_db
 
+# Clients have to revalidate availability on every use
+AVAILABILITY_HEADERS = {"Cache-Control": "no-cache"}
+
 router = APIRouter(
     prefix="/events",
     tags=["events"],
@@ -19,7 +45,7 @@ router = APIRouter(
 
 @router.post(
     "/",
-    response_model=event.Event,
+    response_model=event.EventWithMailTemplates,
     dependencies=[Security(
         get_current_active_user,
         scopes=["events:edit"]
@@ -35,30 +61,109 @@ def create_event(event: event.EventCreate, db: Session = Depends(get_db)):
     "/",
     response_model=list[extra.EventExtra],
     summary="Read events",
+    description="Without filters returns prebuilt catalog of events, it supports `If-None-Match` header with returned `ETag` and gzip or brotli encoding. "
+    "`status` filters events by ticket sales (`open` now, `upcoming` or `closed`), date ranges filter by sales start and end (from inclusive, to exclusive).",
+)
+def read_events(
+    request: Request,
+    event_status: Annotated[extra.EventStatusEnum | None, Query(alias="status")] = None,
+    sales_start_from: datetime | None = None,
+    sales_start_to: datetime | None = None,
+    sales_end_from: datetime | None = None,
+    sales_end_to: datetime | None = None,
+    limit: Annotated[int | None, Query(ge=1, le=1000)] = None,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    db: Session = Depends(get_db),
+):
+    filters = (event_status, sales_start_from, sales_start_to, sales_end_from, sales_end_to, limit)
+    if offset or any(f is not None for f in filters):
+        return schema_response(
+            list[extra.EventExtra],
+            event_service.get_events(
+                db,
+                status=event_status,
+                sales_start_from=sales_start_from,
+                sales_start_to=sales_start_to,
+                sales_end_from=sales_end_from,
+                sales_end_to=sales_end_to,
+                limit=limit,
+                offset=offset,
+            ),
+        )
+
+    catalog = catalog_service.get_catalog()
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    headers = {
+        "Cache-Control": f"public, max-age={settings.catalog_max_age_seconds}",
+        "Vary": "Accept-Encoding",
+    }
+
+    # Any encoding of the current catalog is still valid for the client
+    if any(
+        etag_matches(request.headers.get("If-None-Match"), etag)
+        for etag in catalog.etags.values()
+    ):
+        return not_modified(catalog.etags[encoding], headers)
+
+    headers["ETag"] = catalog.etags[encoding]
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(
+        content=catalog.bodies[encoding],
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+@router.get(
+    "/capacity_summary",
+    response_model=dict[int, extra.CapacitySummary],
+    dependencies=[Security(
+        get_current_active_user,
+        scopes=["events:read"]
+    )],
+    summary="Get info about occupation of many events",
+    description="Returns capacity summary for every given event ID. Requires `events:read` scope.",
 )
-def read_events(db: Session = Depends(get_db)):
-    return models.Event.get_all(db_session=db)
+def get_capacity_summaries(
+    ids: Annotated[list[int], Query()],
+    db: Session = Depends(get_db),
+):
+    return event_service.get_events_capacity_summaries(event_ids=ids, db=db)
 
 
 @router.get(
     "/capacity_summary/{id}",
     response_model=extra.CapacitySummary,
     summary="Get info about event occupation",
-    description="Returns JSON object with capacity summary",
+    description="Returns JSON object with capacity summary. Supports `If-None-Match` header with returned `ETag`.",
 )
-def get_capacity_summary(id: int, db: Session = Depends(get_db)):
-    return event_service.get_event_capacity_summary(
-        event=read_event_by_id(id, db),
-    )
+def get_capacity_summary(
+    id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
+    # Versions of missing events are valid too, so existence goes first
+    if not models.Event.exists(id=id, db_session=db):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Event not found"
+        )
+    # Client already has current version, summary is not computed
+    etag = availability.get_etag("capacity_summary", id)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag, AVAILABILITY_HEADERS)
 
+    def compute():
+        return event_service.get_event_capacity_summary(event_id=id, db=db)
 
-@router.get(
-    "/{id}",
-    response_model=extra.EventExtra,
-    summary="Get info about event by ID",
-    description="Returns event with given ID.",
-)
-def read_event_by_id(id: int, db: Session = Depends(get_db)):
+    summary = availability.get_cached("capacity_summary", id, compute)
+    response.headers.update({"ETag": etag, **AVAILABILITY_HEADERS})
+    return summary
+
+
+def get_event_or_404(id: int, db: Session) -> models.Event:
     event = models.Event.get_by_id(db_session=db, id=id)
     if event is None:
         raise HTTPException(
@@ -68,6 +173,31 @@ def read_event_by_id(id: int, db: Session = Depends(get_db)):
     return event
 
 
+def event_rows(e: models.Event) -> tuple:
+    """Rows whose versions make ETag of the event with ticket groups"""
+    return (e, *e.ticket_groups)
+
+
+@router.get(
+    "/{id}",
+    response_model=extra.EventExtra,
+    summary="Get info about event by ID",
+    description="Returns event with given ID. Supports `If-None-Match` and `If-Modified-Since` headers.",
+)
+def read_event_by_id(
+    id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
+    event = get_event_or_404(id, db)
+    headers = version_headers(*event_rows(event))
+    if is_not_modified(request, headers):
+        return not_modified(headers["ETag"], headers)
+    response.headers.update(headers)
+    return event
+
+
 @router.get(
     "/{id}/tickets",
     response_model=list[ticket.Ticket],
@@ -76,58 +206,229 @@ def read_event_by_id(id: int, db: Session = Depends(get_db)):
         scopes=["tickets:read"]
     )],
     summary="Get tickets by event's ID",
-    description="Returns tickets for the event with the given ID. Requires `tickets:read` scope.",
+    description="Returns tickets for the event with the given ID. With `fields` or `expand` returns flat objects. Requires `tickets:read` scope.",
+)
+def read_event_by_id_with_tickets(
+    id: int,
+    fields: projection.FieldsQuery = None,
+    expand: projection.ExpandQuery = None,
+    db: Session = Depends(get_db),
+):
+    if not models.Event.exists(id=id, db_session=db):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Event not found"
+        )
+
+    if not projection.is_requested(fields, expand):
+        # Full tickets are flat tickets with embedded group and event
+        expand = projection.TICKET_FULL_EXPAND
+    try:
+        return projection.to_response(projection.get_tickets(
+            db, fields, expand,
+            models.Ticket.group_id.in_(
+                select(models.TicketGroup.id).where(
+                    models.TicketGroup.event_id == id)
+            ),
+            order_by=models.Ticket.email,
+        ))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+
+
+@router.get(
+    "/{id}/tickets.{export_format}",
+    response_class=StreamingResponse,
+    dependencies=[Security(
+        get_current_active_user,
+        scopes=["tickets:read"]
+    )],
+    summary="Export tickets of the event",
+    description="Streams tickets of the event as CSV, NDJSON or Parquet ordered by ID. `columns` is a comma separated list of exported columns, `status` filters tickets by status names. Requires `tickets:read` scope.",
 )
-def read_event_by_id_with_tickets(id: int, db: Session = Depends(get_db)):
+def export_event_tickets(
+    id: int,
+    export_format: extra.ExportFormatEnum,
+    columns: str | None = None,
+    ticket_status: Annotated[list[str] | None, Query(alias="status")] = None,
+    db: Session = Depends(get_db),
+):
     if not models.Event.exists(id=id, db_session=db):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Event not found"
         )
+    try:
+        content = ticket_export.export_tickets(
+            export_format,
+            columns=columns,
+            event_ids=[id],
+            statuses=ticket_status,
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+    return StreamingResponse(
+        content,
+        media_type=ticket_export.MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f"attachment; filename=cutetix-event-{id}-tickets.{export_format.value}"}
+    )
 
-    return ticket_service.get_tickets_by_event_id(
-        event_id=id,
-        db=db
+
+@router.get(
+    "/{id}/availability/stream",
+    response_class=StreamingResponse,
+    summary="Watch availability of event's ticket groups",
+    description="Returns Server-Sent Events stream. Message `availability` with free and paid positions per ticket group is sent after every change, at most once per configured interval.",
+)
+def stream_event_availability(id: int, db: Session = Depends(get_db)):
+    if not models.Event.exists(id=id, db_session=db):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Event not found"
+        )
+    return StreamingResponse(
+        availability_stream.sse_messages(id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # disable buffering in nginx
+        },
     )
 
 
+@router.websocket("/{id}/availability/ws")
+async def websocket_event_availability(
+    websocket: WebSocket,
+    id: int,
+    db: Session = Depends(get_db),
+):
+    if not await run_in_threadpool(models.Event.exists, id=id, db_session=db):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    async def send():
+        # Empty object keeps proxies from closing idle connection
+        async for message in availability_stream.messages(id, keep_alive="{}"):
+            await websocket.send_text(message)
+        # Event was deleted
+        await websocket.close()
+
+    async def receive():
+        # Client sends nothing, but disconnect is noticed only by receiving
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = {asyncio.create_task(send()), asyncio.create_task(receive())}
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        # Sending to disconnected client is not an error
+        if isinstance(task.exception(), (WebSocketDisconnect, RuntimeError)):
+            continue
+        task.result()
+
+
 # This endpoint is maybe not needed, because we can get ticket groups with event info in /events/{id} endpoint, but it can be useful if we want to get only ticket groups without event info
 @router.get(
     "/{id}/ticket_groups",
     response_model=list[ticket_group.TicketGroup],
     summary="Get ticket groups by event's ID",
-    description="Returns ticket groups for the event with the given ID.",
+    description="Returns ticket groups for the event with the given ID. With `fields` or `expand` returns flat objects.",
 )
-def read_event_by_id_with_tickets_groups(id: int, db: Session = Depends(get_db)):
+def read_event_by_id_with_tickets_groups(
+    id: int,
+    fields: projection.FieldsQuery = None,
+    expand: projection.ExpandQuery = None,
+    db: Session = Depends(get_db),
+):
     if not models.Event.exists(id=id, db_session=db):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Event not found"
         )
 
-    return models.TicketGroup.get_list_by_param(
-        param_name="event_id",
-        param_value=id,
-        db_session=db,
+    if not projection.is_requested(fields, expand):
+        return schema_response(
+            list[ticket_group.TicketGroup],
+            models.TicketGroup.get_list_by_param(
+                param_name="event_id",
+                param_value=id,
+                db_session=db,
+            ),
+        )
+    try:
+        return projection.to_response(projection.get_ticket_groups(
+            db, fields, expand,
+            models.TicketGroup.event_id == id,
+            order_by=models.TicketGroup.id,
+        ))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+
+
+@router.get(
+    "/{id}/mail_templates",
+    response_model=event.EventWithMailTemplates,
+    dependencies=[Security(
+        get_current_active_user,
+        scopes=["events:read"]
+    )],
+    summary="Get event with mail templates",
+    description="Returns event with given ID including mail templates. Requires `events:read` scope.",
+)
+def read_event_mail_templates(id: int, db: Session = Depends(get_db)):
+    event = db.get(
+        models.Event,
+        id,
+        options=[undefer_group("mail_templates")],
     )
+    if event is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Event not found"
+        )
+    return event
 
 
 @router.patch(
     "/{id}",
-    response_model=event.Event,
+    response_model=event.EventWithMailTemplates,
     dependencies=[Security(
         get_current_active_user,
         scopes=["events:edit"]
     )],
     summary="Partialy edit event",
-    description="Returns updated event. Requires `events:edit` scope.",
+    description="Returns updated event. With `If-Match` header the event is updated only if it was not changed meanwhile. Requires `events:edit` scope.",
 )
 def update_event(
     id: int,
-    updated_event: event.EventBase,
+    updated_event: event.EventCreate,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
     db: Session = Depends(get_db)
 ):
-    return models.Event.update(db_session=db, id=id, **updated_event.model_dump())
+    e = get_event_or_404(id, db)
+    check_if_match(if_match, version_etag(*event_rows(e)))
+    try:
+        e = models.Event.update(db_session=db, id=id, **updated_event.model_dump())
+    except StaleDataError:
+        db.rollback()
+        raise precondition_failed()
+    response.headers.update(version_headers(*event_rows(e)))
+    return e
 
 
 @router.delete(
@@ -158,20 +459,26 @@ def delete_event(id: int, db: Session = Depends(get_db)):
         scopes=["events:read"]
     )],
     summary="Generate event's XLSX",
-    description="Returns XLSX file with tickets in groups. Requires `events:read` scope.",
+    description="Returns XLSX file with tickets in groups. File of a finished export job is returned when tickets have not changed since. Requires `events:read` scope.",
 )
 def get_event_xlsx(id: int, format_for_libor: bool = False, db: Session = Depends(get_db)):
-    event = read_event_by_id(
-        id=id,
-        db=db
-    )
+    event = get_event_or_404(id, db)
+    export_format = ExportJobFormatEnum.xlsx_for_libor if format_for_libor else ExportJobFormatEnum.xlsx
+    artifact = export_jobs.get_artifact(
+        event.id, export_format, export_jobs.get_data_version(event.id, db))
+    if artifact is not None:
+        return FileResponse(
+            artifact,
+            media_type=event_service.XLSX_MEDIA_TYPE,
+            filename=f"cutetix-event-{id}.xlsx",
+        )
     if format_for_libor:
-        table_bytes = event_service.get_event_xlsx_for_libor(event=event)
+        table_bytes = event_service.get_event_xlsx_for_libor(event_id=event.id)
     else:
-        table_bytes = event_service.get_event_xlsx(event=event)
+        table_bytes = event_service.get_event_xlsx(event_id=event.id)
     return StreamingResponse(
         table_bytes,
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        media_type=event_service.XLSX_MEDIA_TYPE,
         headers={
             "Content-Disposition": f"attachment; filename=cutetix-event-{id}.xlsx"}
     )
@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from app import models
+from app.database import get_db
+from app.middleware.auth import get_current_active_user
+from app.schemas.export import ExportJob, ExportJobCreate, ExportJobStatusEnum
+from app.services import export_jobs
+
+router = APIRouter(
+    prefix="/exports",
+    tags=["exports"],
+    dependencies=[Security(
+        get_current_active_user,
+        scopes=["events:read"]
+    )],
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Not found"}
+    },
+)
+
+
+def get_job_or_404(id: str) -> ExportJob:
+    job = export_jobs.get_job(id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Export job not found"
+        )
+    return job
+
+
+@router.post(
+    "/",
+    response_model=ExportJob,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Start export of event",
+    description="Starts export of the event in background. Repeated requests return the same job until tickets of the event change, finished exports are reused. Requires `events:read` scope.",
+)
+def create_export_job(job: ExportJobCreate, db: Session = Depends(get_db)):
+    if not models.Event.exists(id=job.event_id, db_session=db):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Event not found"
+        )
+    try:
+        return export_jobs.create_job(job, db)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+
+
+@router.get(
+    "/{id}",
+    response_model=ExportJob,
+    summary="Read export job",
+    description="Returns state of the export job. Requires `events:read` scope.",
+)
+def read_export_job(id: str):
+    return get_job_or_404(id)
+
+
+@router.get(
+    "/{id}/file",
+    response_class=FileResponse,
+    summary="Download exported file",
+    description="Returns file of the finished export job. Requires `events:read` scope.",
+    responses={
+        status.HTTP_409_CONFLICT: {"description": "Export is not finished"},
+        status.HTTP_410_GONE: {"description": "Exported file was evicted"},
+    },
+)
+def read_export_job_file(id: str):
+    job = get_job_or_404(id)
+    if job.status != ExportJobStatusEnum.done:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Export is {job.status.value}.",
+        )
+    path = export_jobs.get_job_artifact(job)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Exported file was evicted, start the export again.",
+        )
+    return FileResponse(
+        path,
+        media_type=export_jobs.MEDIA_TYPES[job.format],
+        filename=f"cutetix-event-{job.event_id}.{export_jobs.EXTENSIONS[job.format]}",
+    )
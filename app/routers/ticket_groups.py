@@ -1,10 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Security
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status, Security
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from typing import Annotated
 from app import models
 from app.middleware.auth import get_current_active_user
 from app.schemas import ticket_group, extra
 from app.database import get_db
-from app.routers.events import read_event_by_id
+from app.features.http_cache import (
+    check_if_match,
+    etag_matches,
+    is_not_modified,
+    not_modified,
+    precondition_failed,
+    version_etag,
+    version_headers,
+)
+from app.features.serialization import schema_response
+from app.routers.events import AVAILABILITY_HEADERS, get_event_or_404
+from app.services import availability, projection
 from app.services.ticket_groups import get_ticket_groups_with_capacity
 
 router = APIRouter(
@@ -37,44 +50,84 @@ def create_ticket_group(
     "/",
     response_model=list[extra.TicketGroupExtra],
     summary="Read ticket groups",
+    description="With `fields` or `expand` returns flat objects without tickets.",
 )
-def read_ticket_groups(db: Session = Depends(get_db)):
-    return models.TicketGroup.get_all(db_session=db)
+def read_ticket_groups(
+    fields: projection.FieldsQuery = None,
+    expand: projection.ExpandQuery = None,
+    db: Session = Depends(get_db),
+):
+    if not projection.is_requested(fields, expand):
+        return schema_response(
+            list[extra.TicketGroupExtra],
+            models.TicketGroup.get_all(db_session=db),
+        )
+    try:
+        return projection.to_response(projection.get_ticket_groups(
+            db, fields, expand,
+            order_by=models.TicketGroup.id,
+        ))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
 
 
 @router.get(
     "/by-event/{id}",
     response_model=list[ticket_group.TicketGroupWithCapacity],
     summary="Read ticket group by event's  ID",
+    description="Supports `If-None-Match` header with returned `ETag`.",
 )
 def read_ticket_groups_by_event_id(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    event = read_event_by_id(id, db)
-    if event is None:
+    # Versions of missing events are valid too, so existence goes first
+    event = get_event_or_404(id, db)
+    # Client already has current version, groups are not computed
+    etag = availability.get_etag("ticket_groups", id)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag, AVAILABILITY_HEADERS)
+
+    def compute():
+        return get_ticket_groups_with_capacity(event, db)
+
+    tgs = availability.get_cached("ticket_groups", id, compute)
+    response.headers.update({"ETag": etag, **AVAILABILITY_HEADERS})
+    return tgs
+
+
+def get_ticket_group_or_404(id: int, db: Session) -> models.TicketGroup:
+    ticket_group = models.TicketGroup.get_by_id(db_session=db, id=id)
+    if ticket_group is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Event not found."
+            detail="Ticket group not found."
         )
-    return get_ticket_groups_with_capacity(event.ticket_groups)
+    return ticket_group
 
 
 @router.get(
     "/{id}",
     response_model=ticket_group.TicketGroup,
     summary="Read ticket group by ID",
+    description="Supports `If-None-Match` and `If-Modified-Since` headers.",
 )
 def read_ticket_group_by_id(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    ticket_group = models.TicketGroup.get_by_id(db_session=db, id=id)
-    if ticket_group is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Ticket group not found."
-        )
+    ticket_group = get_ticket_group_or_404(id, db)
+    headers = version_headers(ticket_group, ticket_group.event)
+    if is_not_modified(request, headers):
+        return not_modified(headers["ETag"], headers)
+    response.headers.update(headers)
     return ticket_group
 
 
@@ -96,11 +149,13 @@ def read_ticket_group_by_id(
         scopes=["ticket_groups:edit"]
     )],
     summary="Edit ticket group",
-    description="Returns updated object. Requires `ticket_groups:edit` scope.",
+    description="Returns updated object. With `If-Match` header the group is updated only if it was not changed meanwhile. Requires `ticket_groups:edit` scope.",
 )
 def edit_ticket_group(
     id: int,
     updated_ticket_groups: ticket_group.TicketGroupCreate,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
     db: Session = Depends(get_db),
 ):
     # TODO: Test this use case
@@ -109,7 +164,15 @@ def edit_ticket_group(
     #         status_code=status.HTTP_400_BAD_REQUEST,
     #         detail="ID in path does not match ID in user's body."
     #     )
-    return models.TicketGroup.update(db_session=db, id=id, **updated_ticket_groups.model_dump())
+    tg = get_ticket_group_or_404(id, db)
+    check_if_match(if_match, version_etag(tg, tg.event))
+    try:
+        tg = models.TicketGroup.update(db_session=db, id=id, **updated_ticket_groups.model_dump())
+    except StaleDataError:
+        db.rollback()
+        raise precondition_failed()
+    response.headers.update(version_headers(tg, tg.event))
+    return tg
 
 
 @router.delete(
@@ -1,15 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Security
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status, Security
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 from datetime import datetime
+from typing import Annotated
 
 from app import models
 from app.middleware.auth import get_current_active_user
 from app.models import TicketStatusEnum
 from app.schemas import ticket, extra
 from app.database import get_db
+from app.schemas.settings import settings
+from app.features.serialization import stream_response
+from app.features.http_cache import (
+    check_if_match,
+    is_not_modified,
+    not_modified,
+    precondition_failed,
+    version_etag,
+    version_headers,
+)
+from app.services import projection
 from app.services import ticket as ticket_service
+from app.services import ticket_export
+from app.services import ticket_search
+from app.services.idempotency import run_idempotent
 
-from app.services.ticket import create_ticket, create_ticket_easily
+from app.services.ticket import ReservationException, TicketException, create_ticket, create_ticket_easily, create_ticket_order
 
 router = APIRouter(
     prefix="/tickets",
@@ -20,6 +38,27 @@ router = APIRouter(
 )
 
 
+# Reservation failures with their own status, others are 400
+RESERVATION_STATUS_CODES = {
+    extra.ReservationReasonEnum.missing: status.HTTP_404_NOT_FOUND,
+    extra.ReservationReasonEnum.full: status.HTTP_409_CONFLICT,
+}
+
+
+def ticket_error(e: TicketException) -> HTTPException:
+    """Reservation failures carry their reason code for clients"""
+    if isinstance(e, ReservationException):
+        reason = e.precheck.reason
+        return HTTPException(
+            status_code=RESERVATION_STATUS_CODES.get(reason, status.HTTP_400_BAD_REQUEST),
+            detail={"reason": reason.value, "message": str(e)},
+        )
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=str(e),
+    )
+
+
 @router.post(
     "/",
     response_model=ticket.Ticket,
@@ -44,82 +83,243 @@ def create(
     "/easy",
     response_model=ticket.Ticket,
     summary="Create ticket easily",
-    description="Returns created object. Does not require any security scopes."
+    description="Returns created object. Does not require any security scopes. Retries with the same `Idempotency-Key` header return the original response. Failed reservation is answered by 404 (`missing` group), 409 (`full` group) or 400 with `reason` and `message` in `detail`."
 )
-def create_ticket_easy(t: ticket.TicketCreate, db: Session = Depends(get_db)):
-    # Prevent random clients create (for examples) paid tickets
-    t.status = TicketStatusEnum.new
-    t_db = create_ticket_easily(t, db)
+def create_ticket_easy(
+    t: ticket.TicketCreate,
+    idempotency_key: Annotated[str | None, Header()] = None,
+    db: Session = Depends(get_db),
+):
+    def handler():
+        # Prevent random clients create (for examples) paid tickets
+        t.status = TicketStatusEnum.new
+        try:
+            return create_ticket_easily(t, db)
+        except TicketException as e:
+            raise ticket_error(e)
 
-    # Send error when cannot create ticket
-    if t_db is None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Can't create ticket."
-        )
-    return t_db
+    return run_idempotent(
+        key=idempotency_key,
+        scope="tickets/easy",
+        payload=t,
+        response_model=ticket.Ticket,
+        handler=handler,
+        db=db,
+    )
+
+
+@router.post(
+    "/order",
+    response_model=list[ticket.Ticket],
+    summary="Create multiple tickets at once",
+    description="Creates all tickets of the order in one transaction and sends one confirmation e-mail. Returns created objects. Does not require any security scopes. Retries with the same `Idempotency-Key` header return the original response. Failed reservation is answered by 404 (`missing` group), 409 (`full` group) or 400 with `reason` and `message` in `detail`."
+)
+def create_order(
+    order: ticket.TicketOrder,
+    idempotency_key: Annotated[str | None, Header()] = None,
+    db: Session = Depends(get_db),
+):
+    def handler():
+        try:
+            return create_ticket_order(order, db)
+        except TicketException as e:
+            raise ticket_error(e)
+
+    return run_idempotent(
+        key=idempotency_key,
+        scope="tickets/order",
+        payload=order,
+        response_model=list[ticket.Ticket],
+        handler=handler,
+        db=db,
+    )
 
 
 @router.post(
     "/cancel",
     response_model=ticket.Ticket,
     summary="Cancel ticket",
-    description="This route enable users cancel their tickets without any admin work. Does not require any security scopes."
+    description="This route enable users cancel their tickets without any admin work. Does not require any security scopes. Retries with the same `Idempotency-Key` header return the original response."
 )
-def cancel_ticket(ct: extra.CancelTicket, db: Session = Depends(get_db)):
-    t_db = read_ticket_by_id(ct.id, db)
+def cancel_ticket(
+    ct: extra.CancelTicket,
+    idempotency_key: Annotated[str | None, Header()] = None,
+    db: Session = Depends(get_db),
+):
+    def handler():
+        try:
+            ct_db = ticket_service.cancel_ticket(ct=ct, db=db)
+        except TicketException as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e),
+            )
+        if ct_db is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Ticket not found"
+            )
+        return ct_db
 
-    # Send error when cannot cancel ticket
-    if t_db is None:
+    return run_idempotent(
+        key=idempotency_key,
+        scope="tickets/cancel",
+        payload=ct,
+        response_model=ticket.Ticket,
+        handler=handler,
+        db=db,
+    )
+
+
+@router.get(
+    "/",
+    response_model=list[ticket.Ticket],
+    dependencies=[Security(
+        get_current_active_user,
+        scopes=["tickets:read"]
+    )],
+    summary="Read tickets",
+    description="Returns list of object. With `fields` or `expand` returns flat objects. With `stream=true` the list is sent in batches as it's read. Requires `tickets:edit` scope.",
+)
+def read_tickets(
+    fields: projection.FieldsQuery = None,
+    expand: projection.ExpandQuery = None,
+    stream: bool = False,
+    db: Session = Depends(get_db)
+):
+    if not projection.is_requested(fields, expand):
+        # Full tickets are flat tickets with embedded group and event
+        expand = projection.TICKET_FULL_EXPAND
+    try:
+        if stream:
+            return stream_response(projection.iter_tickets(
+                fields, expand,
+                batch_size=settings.list_stream_batch_size,
+            ))
+        return projection.to_response(projection.get_tickets(
+            db, fields, expand,
+            order_by=models.Ticket.id,
+        ))
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Can't cancel ticket. Ticket with given ID not found."
+            detail=str(e),
         )
+
+
+@router.get(
+    "/export.{export_format}",
+    response_class=StreamingResponse,
+    dependencies=[Security(
+        get_current_active_user,
+        scopes=["tickets:read"]
+    )],
+    summary="Export tickets",
+    description="Streams tickets of all or given events as CSV, NDJSON or Parquet ordered by ID. `columns` is a comma separated list of exported columns, `status` filters tickets by status names. Requires `tickets:read` scope.",
+)
+def export_tickets(
+    export_format: extra.ExportFormatEnum,
+    columns: str | None = None,
+    event_id: Annotated[list[int] | None, Query()] = None,
+    ticket_status: Annotated[list[str] | None, Query(alias="status")] = None,
+):
     try:
-        ct_db: ticket.TicketPatch = ticket_service.cancel_ticket(
-            ct=ct,
-            t=t_db,
-            db=db
+        content = ticket_export.export_tickets(
+            export_format,
+            columns=columns,
+            event_ids=event_id,
+            statuses=ticket_status,
         )
-    except Exception as e:
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e),
         )
-    return ct_db
+    return StreamingResponse(
+        content,
+        media_type=ticket_export.MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f"attachment; filename=cutetix-tickets.{export_format.value}"}
+    )
 
 
 @router.get(
-    "/",
+    "/search",
     response_model=list[ticket.Ticket],
     dependencies=[Security(
         get_current_active_user,
         scopes=["tickets:read"]
     )],
-    summary="Read tickets",
-    description="Returns list of object. Requires `tickets:edit` scope.",
+    summary="Search tickets",
+    description="Returns tickets whose e-mail, names or description contain words starting with words of `q`, the most relevant first. `status` filters tickets by status names. With `fields` or `expand` returns flat objects. Requires `tickets:read` scope.",
 )
-def read_tickets(
+def search_tickets(
+    q: Annotated[str, Query(min_length=1, max_length=255)],
+    event_id: int | None = None,
+    ticket_status: Annotated[list[str] | None, Query(alias="status")] = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    fields: projection.FieldsQuery = None,
+    expand: projection.ExpandQuery = None,
     db: Session = Depends(get_db)
 ):
-    return models.Ticket.get_all(db_session=db)
+    if not projection.is_requested(fields, expand):
+        expand = projection.TICKET_FULL_EXPAND
+    try:
+        ids = ticket_search.search_ticket_ids(
+            db, q,
+            event_id=event_id,
+            statuses=ticket_export.parse_statuses(ticket_status),
+            limit=limit,
+            offset=offset,
+        )
+        if not ids:
+            return projection.to_response([])
+        return projection.to_response(projection.get_tickets(
+            db, fields, expand,
+            models.Ticket.id.in_(ids),
+            # Order of relevance
+            order_by=case({id: i for i, id in enumerate(ids)}, value=models.Ticket.id),
+        ))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+
+
+def get_ticket_or_404(id: int, db: Session) -> models.Ticket:
+    ticket = models.Ticket.get_by_id(db_session=db, id=id)
+    if ticket is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ticket not found"
+        )
+    return ticket
+
+
+def ticket_rows(t: models.Ticket) -> tuple:
+    """Rows whose versions make ETag of the ticket with group and event"""
+    return (t, t.group, t.group.event)
 
 
 @router.get(
     "/{id}",
     response_model=ticket.Ticket,
     summary="Read ticket by ID",
+    description="Supports `If-None-Match` and `If-Modified-Since` headers.",
 )
 def read_ticket_by_id(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    ticket = models.Ticket.get_by_id(db_session=db, id=id)
-    if ticket is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Ticket not found"
-        )
+    ticket = get_ticket_or_404(id, db)
+    headers = version_headers(*ticket_rows(ticket))
+    if is_not_modified(request, headers):
+        return not_modified(headers["ETag"], headers)
+    response.headers.update(headers)
     return ticket
 
 
@@ -131,14 +331,24 @@ def read_ticket_by_id(
         scopes=["tickets:edit"]
     )],
     summary="Edit ticket",
-    description="Returns updated. Requires `tickets:edit` scope.",
+    description="Returns updated. With `If-Match` header the ticket is updated only if it was not changed meanwhile. Requires `tickets:edit` scope.",
 )
 def update_ticket(
     id: int,
     updated_ticket: ticket.TicketPatch,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
     db: Session = Depends(get_db)
 ):
-    return models.Ticket.update(db_session=db, id=id, **updated_ticket.model_dump())
+    t = get_ticket_or_404(id, db)
+    check_if_match(if_match, version_etag(*ticket_rows(t)))
+    try:
+        t = models.Ticket.update(db_session=db, id=id, **updated_ticket.model_dump())
+    except StaleDataError:
+        db.rollback()
+        raise precondition_failed()
+    response.headers.update(version_headers(*ticket_rows(t)))
+    return t
 
 
 @router.delete(
@@ -1,12 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, Security, status
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, Security, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 from typing import Annotated
 from uuid import UUID
-from app.middleware.auth import get_current_active_user
-from app.schemas.user import UserFromDB
+from app import models
+from app.features.http_cache import (
+    check_if_match,
+    is_not_modified,
+    not_modified,
+    precondition_failed,
+    version_etag,
+    version_headers,
+)
+from app.features.serialization import schema_response, stream_response
+from app.middleware.auth import get_current_active_user, get_unknown_scopes
+from app.schemas.user import AuthPrincipal, UserFromDB, UserLogin
+from app.schemas.user_bulk import UserImportResult, UserScopesPatch, UserScopesResult
 from app.schemas.event import Event
+from app.schemas.user_favorite_events import UserFavoriteEventsPatch, UserFavoriteEventsPatchResult
+from app.schemas.settings import settings
 from app.database import get_db
 import app.services.user as user_service
+import app.services.user_bulk as user_bulk_service
 
 router = APIRouter(
     prefix="/users",
@@ -26,6 +43,11 @@ def check_user_found(user: UserFromDB) -> UserFromDB:
     return user
 
 
+def user_rows(user: models.User) -> tuple:
+    """Rows whose versions make ETag of the user with favorite events"""
+    return (user, *user.favorite_events)
+
+
 @router.get(
     "/",
     response_model=list[UserFromDB],
@@ -33,10 +55,15 @@ def check_user_found(user: UserFromDB) -> UserFromDB:
         get_current_active_user,
         scopes=["users:read"]
     )],
-    description="Get info about all users. Requires `users:read` scope.",
+    description="Get info about all users. With `stream=true` the list is sent in batches as it's read. Requires `users:read` scope.",
 )
-async def read_all_users(db: Session = Depends(get_db)):
-    return user_service.get_all(db)
+async def read_all_users(stream: bool = False, db: Session = Depends(get_db)):
+    if stream:
+        return stream_response(
+            user_service.iter_all(settings.list_stream_batch_size),
+            UserFromDB,
+        )
+    return schema_response(list[UserFromDB], user_service.get_all(db))
 
 
 @router.get(
@@ -46,9 +73,10 @@ async def read_all_users(db: Session = Depends(get_db)):
     description="Get info about logged in user. Requires to be logged in.",
 )
 async def read_users_me(
-    current_user: Annotated[UserFromDB, Depends(get_current_active_user)],
+    current_user: Annotated[AuthPrincipal, Depends(get_current_active_user)],
+    db: Session = Depends(get_db),
 ):
-    return current_user
+    return check_user_found(user_service.get_by_id(current_user.uuid, db))
 
 
 @router.get(
@@ -57,19 +85,38 @@ async def read_users_me(
     description="Get all favorite events for logged in user. Requires to be logged in.",
 )
 async def read_user_favorite_events(
-    current_user: Annotated[UserFromDB, Depends(get_current_active_user)],
+    current_user: Annotated[AuthPrincipal, Depends(get_current_active_user)],
     db: Session = Depends(get_db)
 ):
     return user_service.get_favorite_events(current_user, db)
 
 
+@router.patch(
+    "/me/favorite_events",
+    response_model=UserFavoriteEventsPatchResult,
+    description="Add and remove many favorite events for logged in user at once. Events already in the wanted state are skipped. Requires to be logged in.",
+)
+async def patch_user_favorite_events(
+    current_user: Annotated[AuthPrincipal, Depends(get_current_active_user)],
+    patch: UserFavoriteEventsPatch,
+    db: Session = Depends(get_db)
+):
+    try:
+        return user_service.patch_favorite_events(current_user, patch, db)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
 @router.post(
     "/me/favorite_events/{event_id}",
     status_code=status.HTTP_201_CREATED,
     description="Add event to favorites for logged in user. Requires to be logged in.",
 )
 async def create_user_favorite_events(
-    current_user: Annotated[UserFromDB, Depends(get_current_active_user)],
+    current_user: Annotated[AuthPrincipal, Depends(get_current_active_user)],
     event_id: int,
     db: Session = Depends(get_db)
 ):
@@ -88,7 +135,7 @@ async def create_user_favorite_events(
     description="Delete event to favorites for logged in user. Requires to be logged in.",
 )
 async def delete_user_favorite_events(
-    current_user: Annotated[UserFromDB, Depends(get_current_active_user)],
+    current_user: Annotated[AuthPrincipal, Depends(get_current_active_user)],
     event_id: int,
     db: Session = Depends(get_db)
 ):
@@ -101,6 +148,61 @@ async def delete_user_favorite_events(
         )
 
 
+@router.post(
+    "/import",
+    response_model=list[UserImportResult],
+    dependencies=[Security(
+        get_current_active_user,
+        scopes=["users:edit"]
+    )],
+    description="Creates users from JSON array or CSV (`Content-Type: text/csv`) with fields of registration, CSV scopes are separated by spaces. Returns result of every row, valid rows are inserted together. Requires `users:edit` scope.",
+    openapi_extra={"requestBody": {"content": {
+        "application/json": {"schema": {"type": "array", "items": UserLogin.model_json_schema()}},
+        "text/csv": {"schema": {"type": "string"}},
+    }, "required": True}},
+)
+async def import_users(request: Request, db: Session = Depends(get_db)):
+    try:
+        body = await request.body()
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            rows = user_bulk_service.parse_csv(body.decode("utf-8-sig"))
+        else:
+            rows = orjson.loads(body)
+            if not isinstance(rows, list):
+                raise ValueError("JSON array of users is expected.")
+        return await run_in_threadpool(user_bulk_service.import_users, rows, db)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+@router.patch(
+    "/scopes",
+    response_model=list[UserScopesResult],
+    dependencies=[Security(
+        get_current_active_user,
+        scopes=["users:edit"]
+    )],
+    description="Grants and revokes scopes of many users at once. Returns result of every user. Requires `users:edit` scope.",
+)
+def patch_user_scopes(patch: UserScopesPatch, db: Session = Depends(get_db)):
+    unknown = get_unknown_scopes(patch.grant)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown scopes: {', '.join(unknown)}."
+        )
+    try:
+        return user_bulk_service.patch_scopes(patch, db)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
 @router.get(
     "/{id}",
     response_model=UserFromDB,
@@ -108,10 +210,20 @@ async def delete_user_favorite_events(
         get_current_active_user,
         scopes=["users:read"]
     )],
-    description="Get info about user by ID. Requires `user:read` scope.",
+    description="Get info about user by ID. Supports `If-None-Match` and `If-Modified-Since` headers. Requires `user:read` scope.",
 )
-async def read_user_by_id(id: UUID, db: Session = Depends(get_db)):
-    return check_user_found(user_service.get_by_id(id, db))
+async def read_user_by_id(
+    id: UUID,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
+    user = check_user_found(user_service.get_by_id(id, db))
+    headers = version_headers(*user_rows(user))
+    if is_not_modified(request, headers):
+        return not_modified(headers["ETag"], headers)
+    response.headers.update(headers)
+    return user
 
 
 @router.get(
@@ -121,10 +233,20 @@ async def read_user_by_id(id: UUID, db: Session = Depends(get_db)):
         get_current_active_user,
         scopes=["users:read"]
     )],
-    description="Get info about user by username. Requires `user:read` scope.",
+    description="Get info about user by username. Supports `If-None-Match` and `If-Modified-Since` headers. Requires `user:read` scope.",
 )
-async def read_user_by_username(username: str, db: Session = Depends(get_db)):
-    return check_user_found(user_service.get_by_username(username, db))
+async def read_user_by_username(
+    username: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
+    user = check_user_found(user_service.get_by_username(username, db))
+    headers = version_headers(*user_rows(user))
+    if is_not_modified(request, headers):
+        return not_modified(headers["ETag"], headers)
+    response.headers.update(headers)
+    return user
 
 
 @router.put(
@@ -134,11 +256,13 @@ async def read_user_by_username(username: str, db: Session = Depends(get_db)):
         get_current_active_user,
         scopes=["users:edit"]
     )],
-    description="Returns updated user. Requires `users:edit` scope.",
+    description="Returns updated user. With `If-Match` header the user is updated only if it was not changed meanwhile. Requires `users:edit` scope.",
 )
 async def update_user(
     id: UUID,
     user: UserFromDB,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
     db: Session = Depends(get_db)
 ):
     if id != user.uuid:
@@ -146,8 +270,16 @@ async def update_user(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="ID in path does not match ID in user's body."
         )
+    current = check_user_found(user_service.get_by_id(id, db))
+    check_if_match(if_match, version_etag(*user_rows(current)))
     user.uuid = user.uuid.bytes
-    return check_user_found(user_service.update(user, db))
+    try:
+        updated = check_user_found(user_service.update(user, db))
+    except StaleDataError:
+        db.rollback()
+        raise precondition_failed()
+    response.headers.update(version_headers(*user_rows(updated)))
+    return updated
 
 
 @router.delete(
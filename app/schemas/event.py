@@ -6,18 +6,35 @@ class EventBase(BaseModel):
     tickets_sales_start: datetime
     tickets_sales_end: datetime
     smtp_mail_from: str
+    hold_duration_minutes: int | None = None
+
+
+class EventMailTemplates(BaseModel):
     mail_text_new_ticket: str
     mail_html_new_ticket: str
     mail_text_cancelled_ticket: str
     mail_html_cancelled_ticket: str
 
 
-class EventCreate(EventBase):
+class EventCreate(EventBase, EventMailTemplates):
     pass
 
 
 class Event(EventBase):
+    """Public event, mail templates are not included"""
     id: int
+    version: int
+    updated_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class EventWithMailTemplates(Event, EventMailTemplates):
+
+    class Config:
+        from_attributes = True
+
+
+class EventFlat(Event):
+    """Event without nested objects"""
@@ -0,0 +1,34 @@
+from datetime import datetime
+from enum import Enum
+from pydantic import BaseModel
+
+
+class ExportJobFormatEnum(str, Enum):
+    xlsx = "xlsx"
+    xlsx_for_libor = "xlsx_for_libor"  # formatted for printing
+    csv = "csv"
+    ndjson = "ndjson"
+    parquet = "parquet"
+
+
+class ExportJobStatusEnum(str, Enum):
+    pending = "pending"  # waiting for or running in the process pool
+    done = "done"
+    failed = "failed"
+
+
+class ExportJobCreate(BaseModel):
+    event_id: int
+    format: ExportJobFormatEnum = ExportJobFormatEnum.xlsx
+
+
+class ExportJob(ExportJobCreate):
+    id: str
+    status: ExportJobStatusEnum = ExportJobStatusEnum.pending
+    data_version: str
+    created_at: datetime
+    finished_at: datetime | None = None
+    error: str | None = None
+
+    class Config:
+        from_attributes = True
@@ -1,3 +1,4 @@
+from enum import Enum
 from pydantic import BaseModel
 from app.schemas.event import Event
 from app.schemas.ticket_group import TicketGroup
@@ -15,6 +16,52 @@ class CapacitySummary(BaseModel):
         from_attributes = True
 
 
+class ReservationReasonEnum(str, Enum):
+    ok = "ok"
+    missing = "missing"
+    closed = "closed"
+    not_open = "not-open"
+    full = "full"
+
+
+class EventStatusEnum(str, Enum):
+    open = "open"  # tickets are on sale now
+    upcoming = "upcoming"  # sale has not started yet
+    closed = "closed"  # sale has ended
+
+
+class ExportFormatEnum(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"  # one JSON object per line
+    parquet = "parquet"
+
+
+class ReservationPrecheck(BaseModel):
+    group_id: int
+    reason: ReservationReasonEnum
+    event_id: int | None = None
+    capacity: int = 0
+    active: int = 0  # count of not cancelled tickets
+    hold_duration_minutes: int | None = None
+
+
+class TicketGroupAvailability(BaseModel):
+    id: int
+    name: str
+    capacity: int
+    free_positions: int
+    paid: int
+    cancelled: int
+
+    class Config:
+        from_attributes = True
+
+
+class EventAvailability(BaseModel):
+    event_id: int
+    ticket_groups: list[TicketGroupAvailability]
+
+
 class CancelTicket(BaseModel):
     id: int
     email: str
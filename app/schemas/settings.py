@@ -10,6 +10,19 @@ class Settings(BaseSettings):
     jwt_algorithm: str = "RS256"
     access_token_expire_minutes: int = 30  # half hour
     refresh_token_expire_minutes: int = 60 * 24 * 7  # one week
+    idempotency_key_expire_minutes: int = 60 * 24  # one day
+    idempotency_key_wait_seconds: int = 30
+    hold_sweep_interval_seconds: int = 60
+    hold_sweep_batch_size: int = 500
+    availability_stream_interval_seconds: float = 1.0
+    catalog_max_age_seconds: int = 60
+    compression_minimum_size: int = 1024  # bytes
+    list_stream_batch_size: int = 1000  # objects encoded at once by `stream=true`
+    export_workers: int = 2
+    export_cache_location: str = "/tmp/cutetix-exports"
+    export_cache_max_bytes: int = 1024 ** 3  # one gibibyte
+    export_cache_max_age_minutes: int = 60 * 24  # one day
+    password_hash_workers: int = 4  # threads hashing passwords of imported users
 
     @property
     def jwt_secret(self):
@@ -21,6 +21,33 @@ class TicketCreate(TicketPatch):
 class Ticket(TicketCreate):
     id: int
     group: TicketGroup
+    hold_until: datetime | None = None
+    version: int
+    updated_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class TicketFlat(TicketCreate):
+    """Ticket without nested objects"""
+    id: int
+    hold_until: datetime | None = None
+    version: int
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class TicketOrderItem(BaseModel):
+    firstname: str
+    lastname: str
+    group_id: int
+    email: str | None = None  # defaults to the e-mail of the order
+    description: str = ""
+
+
+class TicketOrder(BaseModel):
+    email: str
+    tickets: list[TicketOrderItem]
@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel
 from app.schemas.event import Event
 
@@ -17,12 +18,24 @@ class TicketGroupCreate(TicketGroupBase):
 
 class TicketGroup(TicketGroupCreate):
     id: int
+    version: int
+    updated_at: datetime
     event: Event
 
     class Config:
         from_attributes = True
 
 
+class TicketGroupFlat(TicketGroupCreate):
+    """Ticket group without nested objects"""
+    id: int
+    version: int
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class TicketGroupWithCapacity(TicketGroup):
     free_positions: int
     paid: int
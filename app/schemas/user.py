@@ -19,6 +19,17 @@ class UserRegister(UserLogin):
     hashed_password: str | None = None
 
 
+class AuthPrincipal(BaseModel):
+    """Authenticated user, only columns needed for authorization"""
+    uuid: UUID
+    username: str
+    scopes: list[str] = []
+    disabled: bool = False
+
+    class Config:
+        from_attributes = True
+
+
 class UserFromDB(User):
     uuid: UUID
     favorite_events: list[Event]
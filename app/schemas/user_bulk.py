@@ -0,0 +1,35 @@
+from enum import Enum
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+
+class UserImportStatusEnum(str, Enum):
+    created = "created"
+    duplicate = "duplicate"  # username is registered or repeated in the import
+    invalid = "invalid"
+
+
+class UserImportResult(BaseModel):
+    row: int  # from 1, CSV header is not counted
+    username: str | None = None
+    status: UserImportStatusEnum
+    uuid: UUID | None = None
+    error: str | None = None
+
+
+class UserScopesPatch(BaseModel):
+    uuids: list[UUID] = Field(min_length=1, max_length=1000)
+    grant: list[str] = []
+    revoke: list[str] = []
+
+
+class UserScopesStatusEnum(str, Enum):
+    updated = "updated"
+    unchanged = "unchanged"
+    not_found = "not-found"
+
+
+class UserScopesResult(BaseModel):
+    uuid: UUID
+    status: UserScopesStatusEnum
+    scopes: list[str] = []
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.schemas.event import Event
 from app.schemas.user import UserFromDB
@@ -7,3 +7,13 @@ from app.schemas.user import UserFromDB
 class UserFavoriteEvent(BaseModel):
     user: UserFromDB
     event: Event
+
+
+class UserFavoriteEventsPatch(BaseModel):
+    add: list[int] = Field(default_factory=list, max_length=1000)
+    remove: list[int] = Field(default_factory=list, max_length=1000)
+
+
+class UserFavoriteEventsPatchResult(BaseModel):
+    added: int
+    removed: int
@@ -2,13 +2,15 @@
 from jwt import decode, encode, InvalidTokenError
 from datetime import datetime, timedelta, timezone
 from sqlalchemy import update
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
+from typing import Iterator
 from passlib.context import CryptContext
 from uuid import UUID
 from app.schemas.auth import AuthTokenResponse
 from app.schemas.user import UserFromDB
 from app.schemas.settings import settings
-from app.models import AuthTokenFamily, AuthTokenFamilyRevoked, generate_uuid
+from app.database import SessionLocal
+from app.models import AuthTokenFamily, AuthTokenFamilyRevoked, User, generate_uuid
 import app.services.user as user_service
 from app.schemas.auth import AuthTokenFamily as AuthTokenFamilySchema
 # from app.schemas.auth import AuthTokenFamilyRevoked as AuthTokenFamilyRevokedSchema
@@ -134,6 +136,15 @@ def get_refresh_token_family_all(
     return AuthTokenFamily.get_all(db)
 
 
+def iter_refresh_token_family_all(batch_size: int) -> Iterator[list[AuthTokenFamily]]:
+    """Yields batches of all token families with users, it uses its own session"""
+    with SessionLocal() as db:
+        yield from AuthTokenFamily.iter_batches(
+            db, batch_size,
+            selectinload(AuthTokenFamily.user).selectinload(User.favorite_events),
+        )
+
+
 def get_refresh_token_family_by_id(
     uuid: UUID,
     db: Session
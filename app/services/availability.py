@@ -0,0 +1,138 @@
+"""
+Module for caching availability of events
+
+Every event has a version which is increased after each committed change
+of its tickets, ticket groups or the event itself. Computed availability
+is cached with the version, so polling endpoints hit the database only
+after a change. The cache lives in the process, so with more workers each
+worker keeps (and invalidates) its own copy.
+"""
+import threading
+from itertools import chain
+from typing import Any, Callable, Iterable
+from uuid import uuid4
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, attributes
+from app import models
+from app.database import SessionLocal
+
+# ETags of previous process must not match after restart
+_BOOT_ID = uuid4().hex[:8]
+_SESSION_KEY = "availability_event_ids"
+
+_lock = threading.Lock()
+_versions: dict[int, int] = {}
+_cache: dict[tuple[str, int], tuple[int, Any]] = {}
+_group_event_ids: dict[int, int] = {}
+_listeners: list[Callable[[set[int]], None]] = []
+
+
+def get_version(event_id: int) -> int:
+    return _versions.get(event_id, 0)
+
+
+def get_etag(kind: str, event_id: int) -> str:
+    return f'"{kind}-{_BOOT_ID}-{event_id}-{get_version(event_id)}"'
+
+
+def add_listener(listener: Callable[[set[int]], None]):
+    """Registers function called with IDs of events after each invalidation"""
+    _listeners.append(listener)
+
+
+def invalidate(event_ids: Iterable[int]):
+    """Increases versions of events and drops their cached values"""
+    event_ids = set(event_ids)
+    with _lock:
+        for event_id in event_ids:
+            _versions[event_id] = _versions.get(event_id, 0) + 1
+            for key in [key for key in _cache if key[1] == event_id]:
+                del _cache[key]
+    for listener in _listeners:
+        listener(event_ids)
+
+
+def get_cached(kind: str, event_id: int, compute: Callable[[], Any]) -> Any:
+    """
+    @brief Returns cached value for current version of the event
+    @param kind name of the cached value
+    @param event_id identifier of the event
+    @param compute function for computing the value on cache miss
+    """
+    version = get_version(event_id)
+    with _lock:
+        cached = _cache.get((kind, event_id))
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    value = compute()
+    with _lock:
+        # Do not store value computed before concurrent invalidation
+        if get_version(event_id) == version:
+            _cache[(kind, event_id)] = (version, value)
+    return value
+
+
+def _get_event_ids_of_groups(group_ids: set[int], db: Session) -> set[int]:
+    missing = [id for id in group_ids if id not in _group_event_ids]
+    if missing:
+        # Connection is used directly, because session is flushing now
+        rows = db.connection().execute(
+            select(models.TicketGroup.id, models.TicketGroup.event_id).where(
+                models.TicketGroup.id.in_(missing)
+            )
+        )
+        for group_id, event_id in rows:
+            _group_event_ids[group_id] = event_id
+    return {
+        _group_event_ids[id]
+        for id in group_ids
+        if id in _group_event_ids
+    }
+
+
+def _history(obj: Any, key: str) -> set:
+    """Returns current and previous values of the attribute"""
+    history = attributes.get_history(obj, key)
+    return {
+        value
+        for value in chain(history.added, history.unchanged, history.deleted)
+        if value is not None
+    }
+
+
+def mark_groups_changed(db: Session, group_ids: Iterable[int]):
+    """
+    Marks events of ticket groups as changed in the current transaction.
+    It's needed for bulk statements, which bypass the unit of work.
+    """
+    db.info.setdefault(_SESSION_KEY, set()).update(
+        _get_event_ids_of_groups(set(group_ids), db)
+    )
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changed_events(db: Session, flush_context):
+    event_ids = db.info.setdefault(_SESSION_KEY, set())
+    group_ids = set()
+    for obj in chain(db.new, db.dirty, db.deleted):
+        if isinstance(obj, models.Ticket):
+            group_ids |= _history(obj, "group_id")
+        elif isinstance(obj, models.TicketGroup):
+            event_ids |= _history(obj, "event_id")
+            _group_event_ids.pop(obj.id, None)
+        elif isinstance(obj, models.Event):
+            event_ids |= _history(obj, "id")
+    event_ids |= _get_event_ids_of_groups(group_ids, db)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_changed_events(db: Session):
+    event_ids = db.info.pop(_SESSION_KEY, None)
+    if event_ids:
+        invalidate(event_ids)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _forget_changed_events(db: Session, previous_transaction):
+    db.info.pop(_SESSION_KEY, None)
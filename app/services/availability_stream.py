@@ -0,0 +1,169 @@
+"""
+Module for pushing availability of events to connected clients
+
+There is one broadcaster per watched event. It computes availability once
+per change (at most once per `availability_stream_interval_seconds`) and
+sends the same message to all its subscribers.
+"""
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from fastapi.concurrency import run_in_threadpool
+from app import models
+from app.database import SessionLocal
+from app.schemas import extra
+from app.schemas.settings import settings
+from app.services import availability
+from app.services.ticket_groups import get_ticket_groups_with_capacity
+
+KEEP_ALIVE_SECONDS = 15
+
+_loop: asyncio.AbstractEventLoop | None = None
+_broadcasters: dict[int, "AvailabilityBroadcaster"] = {}
+
+
+def get_event_availability(event_id: int) -> str | None:
+    """Returns availability of the event as JSON or None if event not exists"""
+    with SessionLocal() as db:
+        event = models.Event.get_by_id(db_session=db, id=event_id)
+        if event is None:
+            return None
+        tgs = availability.get_cached(
+            "ticket_groups",
+            event_id,
+            lambda: get_ticket_groups_with_capacity(event, db),
+        )
+    return extra.EventAvailability(
+        event_id=event_id,
+        ticket_groups=[
+            extra.TicketGroupAvailability.model_validate(tg)
+            for tg in tgs
+        ],
+    ).model_dump_json()
+
+
+class AvailabilityBroadcaster:
+    """Class for sending availability of one event to all subscribers"""
+
+    def __init__(self, event_id: int):
+        self.event_id = event_id
+        self.subscribers: set[asyncio.Queue] = set()
+        self.changed = asyncio.Event()
+        self.changed.set()  # first subscriber needs current state
+        self.last_message: str | None = None
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            try:
+                message = await run_in_threadpool(
+                    get_event_availability, self.event_id)
+            except Exception as e:
+                print(
+                    f"Availability of event {self.event_id} failed: {e}",
+                    file=sys.stderr,
+                )
+                # Try again after the interval
+                self.changed.set()
+            else:
+                if message is None:
+                    # Event was deleted, None ends subscriptions
+                    for queue in self.subscribers:
+                        _put_latest(queue, None)
+                    return
+                if message != self.last_message:
+                    self.last_message = message
+                    for queue in self.subscribers:
+                        _put_latest(queue, message)
+            # Coalesce burst of changes into one message
+            await asyncio.sleep(settings.availability_stream_interval_seconds)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=1)
+        if self.last_message is not None:
+            queue.put_nowait(self.last_message)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+
+def _put_latest(queue: asyncio.Queue, message: str):
+    """Slow subscriber gets only the newest message"""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+def _mark_changed(event_ids: set[int]):
+    for event_id in event_ids:
+        broadcaster = _broadcasters.get(event_id)
+        if broadcaster is not None:
+            broadcaster.changed.set()
+
+
+def _on_invalidate(event_ids: set[int]):
+    # Invalidation comes from worker threads, broadcasters live in event loop
+    if _loop is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_mark_changed, event_ids)
+
+
+availability.add_listener(_on_invalidate)
+
+
+@asynccontextmanager
+async def subscription(event_id: int):
+    """
+    @brief Subscribes to availability of the event
+    @param event_id identifier of the event
+    @return Queue with JSON messages
+    """
+    global _loop
+    _loop = asyncio.get_running_loop()
+
+    broadcaster = _broadcasters.get(event_id)
+    if broadcaster is None or broadcaster.task.done():
+        broadcaster = _broadcasters[event_id] = AvailabilityBroadcaster(event_id)
+    queue = broadcaster.subscribe()
+    try:
+        yield queue
+    finally:
+        broadcaster.unsubscribe(queue)
+        # Stop computing availability nobody watches
+        if not broadcaster.subscribers:
+            broadcaster.task.cancel()
+            if _broadcasters.get(event_id) is broadcaster:
+                del _broadcasters[event_id]
+
+
+async def messages(event_id: int, keep_alive: str) -> AsyncIterator[str]:
+    """
+    @brief Yields availability of the event as JSON after every change
+    @param keep_alive message yielded after `KEEP_ALIVE_SECONDS` without change
+    @return Iterator ending when the event is deleted
+    """
+    async with subscription(event_id) as queue:
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    queue.get(), timeout=KEEP_ALIVE_SECONDS)
+            except TimeoutError:
+                yield keep_alive
+                continue
+            if message is None:
+                return
+            yield message
+
+
+async def sse_messages(event_id: int) -> AsyncIterator[str]:
+    """Generates Server-Sent Events with availability of the event"""
+    # Comment keeps proxies from closing idle connection
+    async for message in messages(event_id, keep_alive=""):
+        if not message:
+            yield ": keep-alive\n\n"
+        else:
+            yield f"event: availability\ndata: {message}\n\n"
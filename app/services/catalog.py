@@ -0,0 +1,84 @@
+"""
+Module for the public catalog of events
+
+The catalog is serialized and compressed once and kept in memory as bytes.
+It's rebuilt on the next request after a committed change of events or
+ticket groups, so serving it is a dictionary lookup.
+"""
+import threading
+from hashlib import blake2b
+from sqlalchemy import event
+from sqlalchemy.orm import Session, selectinload
+from app import models
+from app.database import SessionLocal
+from app.features.compression import ENCODINGS, compress
+from app.features.serialization import dump_json
+from app.schemas import extra
+
+_SESSION_KEY = "catalog_changed"
+
+
+class Catalog:
+    """Class holding serialized catalog and its compressed variants"""
+
+    def __init__(self, body: bytes):
+        digest = blake2b(body, digest_size=12).hexdigest()
+        self.bodies: dict[str | None, bytes] = {None: body}
+        self.etags: dict[str | None, str] = {None: f'"catalog-{digest}"'}
+        for encoding in ENCODINGS:
+            self.bodies[encoding] = compress(body, encoding, precompressed=True)
+            self.etags[encoding] = f'"catalog-{digest}-{encoding}"'
+
+
+_lock = threading.Lock()
+_generation = 0  # increased after every change
+_catalog: Catalog | None = None
+_catalog_generation = -1
+
+
+def build_catalog() -> Catalog:
+    with SessionLocal() as db:
+        events = db.query(models.Event).options(
+            selectinload(models.Event.ticket_groups)
+        ).order_by(models.Event.id).all()
+        body = dump_json(list[extra.EventExtra], events)
+    return Catalog(body)
+
+
+def get_catalog() -> Catalog:
+    """Returns current catalog, it's rebuilt only after change"""
+    global _catalog, _catalog_generation
+    if _catalog is not None and _catalog_generation == _generation:
+        return _catalog
+    with _lock:
+        # Other thread could rebuild it meanwhile
+        if _catalog is not None and _catalog_generation == _generation:
+            return _catalog
+        generation = _generation
+        catalog = build_catalog()
+        _catalog, _catalog_generation = catalog, generation
+        return catalog
+
+
+def invalidate():
+    global _generation
+    _generation += 1
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_catalog_changes(db: Session, flush_context):
+    for obj in (*db.new, *db.dirty, *db.deleted):
+        if isinstance(obj, (models.Event, models.TicketGroup)):
+            db.info[_SESSION_KEY] = True
+            return
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_catalog(db: Session):
+    if db.info.pop(_SESSION_KEY, False):
+        invalidate()
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _forget_catalog_changes(db: Session, previous_transaction):
+    db.info.pop(_SESSION_KEY, None)
@@ -1,68 +1,203 @@
 """Module for easier event management"""
-from app.models import Event, TicketStatusEnum
+from datetime import datetime
+from functools import cache, partial
+from typing import BinaryIO, Iterator
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+from app.database import SessionLocal
+from app.features.streaming import iter_written
+from app.features.xlsx import SheetBlueprint
+from app.models import Event, Ticket, TicketGroup, TicketStatusEnum
 from app.schemas import extra
-from openpyxl import Workbook, load_workbook
+from itertools import groupby
+from operator import attrgetter
+from openpyxl import Workbook
 from openpyxl.workbook.child import INVALID_TITLE_REGEX
-from tempfile import NamedTemporaryFile
-from io import BytesIO
-import sys
+from pathlib import Path
 import re
 
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Count of tickets fetched from the database at once
+XLSX_BATCH_SIZE = 1000
 
-def get_event_capacity_summary(event: Event):
-    if not event:
-        print(
-            "There is not event",
-            file=sys.stderr,
+LIBOR_TEMPLATE = Path(__file__).parent / "cutetix-event-formatted-for-Libor.xlsx"
+FIRST_ROW_TO_UPDATE = 3
+
+
+def get_events(
+    db: Session,
+    status: extra.EventStatusEnum | None = None,
+    sales_start_from: datetime | None = None,
+    sales_start_to: datetime | None = None,
+    sales_end_from: datetime | None = None,
+    sales_end_to: datetime | None = None,
+    limit: int | None = None,
+    offset: int = 0,
+) -> list[Event]:
+    """
+    Returns events filtered by sales status and date ranges.
+    Every filter is a range over `tickets_sales_start` or `tickets_sales_end`,
+    so the query is an index range scan. Events are ordered by the index
+    the status uses (open by sales end, upcoming by sales start, closed
+    by sales end descending), so no sorting is needed.
+    """
+    now = datetime.now()
+    where = []
+    order_by = [Event.id]
+    if status == extra.EventStatusEnum.open:
+        where += [Event.tickets_sales_end > now, Event.tickets_sales_start <= now]
+        order_by = [Event.tickets_sales_end, Event.tickets_sales_start, Event.id]
+    elif status == extra.EventStatusEnum.upcoming:
+        where += [Event.tickets_sales_start > now]
+        order_by = [Event.tickets_sales_start, Event.tickets_sales_end, Event.id]
+    elif status == extra.EventStatusEnum.closed:
+        where += [Event.tickets_sales_end <= now]
+        order_by = [
+            Event.tickets_sales_end.desc(),
+            Event.tickets_sales_start.desc(),
+            Event.id.desc(),
+        ]
+
+    if sales_start_from is not None:
+        where.append(Event.tickets_sales_start >= sales_start_from)
+    if sales_start_to is not None:
+        where.append(Event.tickets_sales_start < sales_start_to)
+    if sales_end_from is not None:
+        where.append(Event.tickets_sales_end >= sales_end_from)
+    if sales_end_to is not None:
+        where.append(Event.tickets_sales_end < sales_end_to)
+
+    stmt = select(Event).options(
+        selectinload(Event.ticket_groups)
+    ).where(*where).order_by(*order_by).offset(offset)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return list(db.scalars(stmt))
+
+
+def get_events_capacity_summaries(
+    event_ids: list[int],
+    db: Session,
+) -> dict[int, extra.CapacitySummary]:
+    """
+    Summarizes capacity of many events by one aggregate query.
+    Tickets are counted per ticket group and status in the database,
+    so memory does not depend on count of tickets.
+    """
+    rows = db.execute(
+        select(
+            TicketGroup.event_id,
+            TicketGroup.id,
+            TicketGroup.capacity,
+            Ticket.status,
+            func.count(Ticket.id).label("count"),
+        ).outerjoin(
+            Ticket,
+            Ticket.group_id == TicketGroup.id,
+        ).where(
+            TicketGroup.event_id.in_(event_ids)
+        ).group_by(
+            TicketGroup.event_id,
+            TicketGroup.id,
+            TicketGroup.capacity,
+            Ticket.status,
         )
+    ).all()
 
     # Prepare response
-    cs = extra.CapacitySummary()
-
-    for tg in event.ticket_groups:
-        cs.total += tg.capacity
-        tg_free = tg.capacity
-        for t in tg.tickets:
-            # Increase per status
-            if t.status == TicketStatusEnum.new:
-                cs.reserved += 1
-            # elif t.status == TicketStatusEnum.confirmed:
-            elif t.status == TicketStatusEnum.paid:
-                cs.paid += 1
-            elif t.status == TicketStatusEnum.cancelled:
-                cs.cancelled += 1
-
-            # Decrase free tickets
-            if not t.status == TicketStatusEnum.cancelled:
-                tg_free -= 1
-        cs.free += tg_free
-    return cs
-
-
-def get_event_xlsx(event: Event):
-
-    # Create workbook
-    wb = Workbook(iso_dates=True)
-
-    for tg in event.ticket_groups:
-        # Create worksheet for ticket group
-        title = re.sub(INVALID_TITLE_REGEX, '_', tg.name)
-        ws = wb.create_sheet(title=title)
-
-        # Create heading
-        ws.append([
-            "Lastname",
-            "Firstname",
-            "E-mail",
-            "Description",
-            "Status",
-            "Ticket ID",
-            "Order date",
-        ])
-
-        for t in tg.tickets:
-            # Add row with ticket
+    summaries = {
+        event_id: extra.CapacitySummary()
+        for event_id in event_ids
+    }
+    counted_groups = set()
+    for row in rows:
+        cs = summaries[row.event_id]
+
+        # Count capacity only once per ticket group
+        if row.id not in counted_groups:
+            counted_groups.add(row.id)
+            cs.total += row.capacity
+            cs.free += row.capacity
+
+        # Increase per status
+        if row.status == TicketStatusEnum.new:
+            cs.reserved += row.count
+        # elif row.status == TicketStatusEnum.confirmed:
+        elif row.status == TicketStatusEnum.paid:
+            cs.paid += row.count
+        elif row.status == TicketStatusEnum.cancelled:
+            cs.cancelled += row.count
+
+        # Decrase free tickets
+        if row.status is not None and row.status != TicketStatusEnum.cancelled:
+            cs.free -= row.count
+    return summaries
+
+
+def get_event_capacity_summary(event_id: int, db: Session) -> extra.CapacitySummary:
+    return get_events_capacity_summaries([event_id], db)[event_id]
+
+
+def get_event_xlsx(event_id: int) -> Iterator[bytes]:
+    """
+    Streams XLSX with tickets of the event, one worksheet per ticket group.
+    Write-only worksheets are filled from a server-side cursor and the ZIP
+    is sent while it's written, so memory does not depend on count of tickets.
+    """
+    return iter_written(partial(write_event_xlsx, event_id))
+
+
+def write_event_xlsx(event_id: int, out: BinaryIO):
+    # Create workbook, write-only workbook has no default sheet
+    wb = Workbook(write_only=True, iso_dates=True)
+
+    with SessionLocal() as db:
+        groups = db.execute(
+            select(TicketGroup.id, TicketGroup.name).where(
+                TicketGroup.event_id == event_id
+            ).order_by(TicketGroup.id)
+        ).all()
+
+        sheets = {}
+        for tg in groups:
+            # Create worksheet for ticket group
+            title = re.sub(INVALID_TITLE_REGEX, '_', tg.name)
+            ws = wb.create_sheet(title=title)
+
+            # Create heading
             ws.append([
+                "Lastname",
+                "Firstname",
+                "E-mail",
+                "Description",
+                "Status",
+                "Ticket ID",
+                "Order date",
+            ])
+            sheets[tg.id] = ws
+        if not sheets:
+            # XLSX needs at least one worksheet
+            wb.create_sheet()
+
+        tickets = db.execute(
+            select(
+                Ticket.group_id,
+                Ticket.lastname,
+                Ticket.firstname,
+                Ticket.email,
+                Ticket.description,
+                Ticket.status,
+                Ticket.id,
+                Ticket.order_date,
+            ).join(TicketGroup).where(
+                TicketGroup.event_id == event_id
+            ).order_by(
+                Ticket.group_id, Ticket.id
+            ).execution_options(yield_per=XLSX_BATCH_SIZE)
+        )
+        for t in tickets:
+            # Add row with ticket
+            sheets[t.group_id].append([
                 t.lastname,
                 t.firstname,
                 t.email,
@@ -72,64 +207,86 @@ def get_event_xlsx(event: Event):
                 t.order_date,
             ])
 
-    # Remove default blank sheet
-    if 'Sheet' in wb.sheetnames:
-        del wb['Sheet']
+    wb.save(out)
 
-    # Return workbook
-    with NamedTemporaryFile() as tmp:
-        wb.save(tmp.name)
-        return BytesIO(tmp.read())
 
+@cache
+def get_libor_blueprint() -> SheetBlueprint:
+    """
+    Returns layout of the formatted template, it's parsed only once
+    Server parses it at startup, export worker processes on first use.
+    """
+    return SheetBlueprint(LIBOR_TEMPLATE, "default")
 
-def get_event_xlsx_for_libor(event: Event):
 
-    # Load formatted workbook
-    wb = load_workbook(
-        filename="./app/services/cutetix-event-formatted-for-Libor.xlsx")
+def get_event_xlsx_for_libor(event_id: int) -> Iterator[bytes]:
+    """
+    Streams XLSX formatted for printing, one worksheet per ticket group.
+    Groups and not cancelled tickets come sorted from the database.
+    """
+    return iter_written(partial(write_event_xlsx_for_libor, event_id))
 
-    # Sort time groups
-    tgs = sorted(event.ticket_groups, key=lambda tg: tg.name.lower())
 
-    FIRST_ROW_TO_UPDATE = 3
-    for tg in tgs:
-        # Create worksheet for ticket group
-        title = re.sub(INVALID_TITLE_REGEX, '_', tg.name)
-        default_ws = wb["default"]
-        ws = wb.copy_worksheet(from_worksheet=default_ws)
-        ws.title = title
+def write_event_xlsx_for_libor(event_id: int, out: BinaryIO):
+    blueprint = get_libor_blueprint()
+    wb = Workbook(write_only=True, iso_dates=True)
 
-        # Update title of time group
-        ws.cell(row=1, column=1, value=tg.name)
+    with SessionLocal() as db:
+        # Sort time groups
+        group_order = (func.lower(TicketGroup.name), TicketGroup.id)
+        groups = db.execute(
+            select(TicketGroup.id, TicketGroup.name).where(
+                TicketGroup.event_id == event_id
+            ).order_by(*group_order)
+        ).all()
 
-        # Sort tickets
-        tickets = sorted(
-            tg.tickets, key=lambda ticket: ticket.lastname.lower())
+        # Tickets in the same order of groups, sorted and without cancelled
+        tickets = db.execute(
+            select(
+                Ticket.group_id,
+                Ticket.lastname,
+                Ticket.firstname,
+                Ticket.email,
+            ).join(TicketGroup).where(
+                TicketGroup.event_id == event_id,
+                Ticket.status != TicketStatusEnum.cancelled,
+            ).order_by(
+                *group_order, func.lower(Ticket.lastname), Ticket.id
+            ).execution_options(yield_per=XLSX_BATCH_SIZE)
+        )
+        tickets_by_group = groupby(tickets, key=attrgetter("group_id"))
+        current = next(tickets_by_group, None)
 
-        # Set ticket offset
-        i = 0
-        for t in tickets:
-            # Filter cancelled tickets
-            if t.status == TicketStatusEnum.cancelled:
-                continue
+        for tg in groups:
+            # Create worksheet for ticket group
+            title = re.sub(INVALID_TITLE_REGEX, '_', tg.name)
+            ws = blueprint.create_sheet(wb, title)
 
-            # Add row with ticket
-            row_number = FIRST_ROW_TO_UPDATE + i
+            # Update title of time group
+            blueprint.append_row(ws, 1, {1: tg.name})
+            blueprint.append_row(ws, 2)
+
+            has_tickets = current is not None and current[0] == tg.id
+            group_tickets = current[1] if has_tickets else []
 
-            # Update WorkSheet with
-            ws.cell(row=row_number, column=1, value=(i+1))
-            ws.cell(row=row_number, column=2, value=t.lastname)  # Lastname
-            ws.cell(row=row_number, column=3, value=t.firstname)  # Firstname
-            ws.cell(row=row_number, column=4, value=t.email)     # E-mail
+            row_number = FIRST_ROW_TO_UPDATE
+            for i, t in enumerate(group_tickets):
+                blueprint.append_row(ws, row_number, {
+                    1: i + 1,
+                    2: t.lastname,
+                    3: t.firstname,
+                    4: t.email,
+                })
+                row_number += 1
+            if has_tickets:
+                current = next(tickets_by_group, None)
 
-            # Increase ticket offset
-            i += 1
+            # Rest of the template (empty numbered rows)
+            for number in range(row_number, len(blueprint.rows) + 1):
+                blueprint.append_row(ws, number)
 
-    # Remove default styled sheet
-    if "default" in wb.sheetnames:
-        del wb['default']
+        if not groups:
+            # XLSX needs at least one worksheet
+            wb.create_sheet()
 
-    # Return workbook
-    with NamedTemporaryFile() as tmp:
-        wb.save(tmp.name)
-        return BytesIO(tmp.read())
+    wb.save(out)
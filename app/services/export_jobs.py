@@ -0,0 +1,276 @@
+"""
+Module for export jobs running in a process pool
+
+Exports of big events take seconds of CPU, so they are built by worker
+processes instead of threads serving requests. Finished files are stored
+on local disk under names made of the event, the format and the data
+version of the event. The data version changes with every change of the
+event, its ticket groups or tickets, so identical requests share one job
+and reuse its file until the data change.
+
+Job IDs are derived from the file names, so finished jobs are found on
+disk by every process using the same directory. Pending and failed jobs
+are known only to the process which started them.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from pathlib import Path
+from time import time
+from uuid import uuid4
+from sqlalchemy import Select, func, select
+from sqlalchemy.orm import Session
+from app.models import Event, Ticket, TicketGroup
+from app.schemas.export import ExportJob, ExportJobCreate, ExportJobFormatEnum, ExportJobStatusEnum
+from app.schemas.extra import ExportFormatEnum
+from app.schemas.settings import settings
+from app.services import event as event_service
+from app.services import ticket_export
+
+EXTENSIONS = {
+    ExportJobFormatEnum.xlsx: "xlsx",
+    ExportJobFormatEnum.xlsx_for_libor: "xlsx",
+    ExportJobFormatEnum.csv: "csv",
+    ExportJobFormatEnum.ndjson: "ndjson",
+    ExportJobFormatEnum.parquet: "parquet",
+}
+MEDIA_TYPES = {
+    ExportJobFormatEnum.xlsx: event_service.XLSX_MEDIA_TYPE,
+    ExportJobFormatEnum.xlsx_for_libor: event_service.XLSX_MEDIA_TYPE,
+    ExportJobFormatEnum.csv: ticket_export.MEDIA_TYPES[ExportFormatEnum.csv],
+    ExportJobFormatEnum.ndjson: ticket_export.MEDIA_TYPES[ExportFormatEnum.ndjson],
+    ExportJobFormatEnum.parquet: ticket_export.MEDIA_TYPES[ExportFormatEnum.parquet],
+}
+
+_lock = threading.Lock()
+_executor: ProcessPoolExecutor | None = None
+_jobs: dict[str, ExportJob] = {}
+
+
+def get_data_version(event_id: int, db: Session) -> str:
+    """
+    Returns digest of the event version and aggregates of its ticket groups
+    and tickets. Every update increases a row version, inserted and deleted
+    rows change counts and sums of IDs. SQLite reuses ID of the deleted
+    newest row, such replacement changes the latest `updated_at`.
+    """
+    event_version = db.scalar(select(Event.version).where(Event.id == event_id))
+    groups = db.execute(
+        _select_aggregates(TicketGroup).where(TicketGroup.event_id == event_id)
+    ).one()
+    tickets = db.execute(
+        _select_aggregates(Ticket).join(TicketGroup).where(TicketGroup.event_id == event_id)
+    ).one()
+    state = repr((event_version, tuple(groups), tuple(tickets)))
+    return blake2b(state.encode(), digest_size=8).hexdigest()
+
+
+def _select_aggregates(model: type[Ticket] | type[TicketGroup]) -> Select:
+    return select(
+        func.count(model.id),
+        func.coalesce(func.sum(model.id), 0),
+        func.coalesce(func.sum(model.version), 0),
+        func.max(model.id),
+        func.max(model.updated_at),
+    )
+
+
+def _job_id(event_id: int, export_format: ExportJobFormatEnum, data_version: str) -> str:
+    return f"{event_id}-{export_format.value}-{data_version}"
+
+
+def _parse_job_id(job_id: str) -> tuple[int, ExportJobFormatEnum, str] | None:
+    try:
+        event_id, export_format, data_version = job_id.split("-")
+        return int(event_id), ExportJobFormatEnum(export_format), data_version
+    except ValueError:
+        return None
+
+
+def _artifact_path(event_id: int, export_format: ExportJobFormatEnum, data_version: str) -> Path:
+    name = f"event-{_job_id(event_id, export_format, data_version)}.{EXTENSIONS[export_format]}"
+    return Path(settings.export_cache_location) / name
+
+
+def get_artifact(event_id: int, export_format: ExportJobFormatEnum, data_version: str) -> Path | None:
+    """Returns path of the stored file, its age is reset, so it's evicted last"""
+    path = _artifact_path(event_id, export_format, data_version)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def build_artifact(event_id: int, export_format: ExportJobFormatEnum, path: str):
+    """
+    Writes the export into the file, it runs in a worker process.
+    File is written under temporary name and renamed when it's complete,
+    so readers never see a partial file.
+    """
+    tmp = f"{path}.{uuid4().hex}.tmp"
+    try:
+        with open(tmp, "wb") as out:
+            if export_format == ExportJobFormatEnum.xlsx:
+                event_service.write_event_xlsx(event_id, out)
+            elif export_format == ExportJobFormatEnum.xlsx_for_libor:
+                event_service.write_event_xlsx_for_libor(event_id, out)
+            else:
+                for chunk in ticket_export.export_tickets(
+                    ExportFormatEnum(export_format.value),
+                    event_ids=[event_id],
+                ):
+                    out.write(chunk)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Spawned workers do not inherit threads and connections of the server
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.export_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def shutdown():
+    """Stops worker processes, pending jobs are cancelled"""
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _finish(job: ExportJob, future: Future):
+    with _lock:
+        job.finished_at = datetime.now()
+        if future.cancelled():
+            job.status = ExportJobStatusEnum.failed
+            job.error = "Export was cancelled."
+        elif future.exception() is not None:
+            job.status = ExportJobStatusEnum.failed
+            job.error = str(future.exception())
+        else:
+            job.status = ExportJobStatusEnum.done
+    if job.status == ExportJobStatusEnum.done:
+        _remove_stale_artifacts(job)
+
+
+def create_job(job_create: ExportJobCreate, db: Session) -> ExportJob:
+    """
+    @brief Starts export of the event in current data version
+    @return New job, the pending or finished job of the same export
+    """
+    event_id, export_format = job_create.event_id, job_create.format
+    data_version = get_data_version(event_id, db)
+    job_id = _job_id(event_id, export_format, data_version)
+    path = _artifact_path(event_id, export_format, data_version)
+
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None and job.status == ExportJobStatusEnum.pending:
+            return job
+        job = ExportJob(
+            id=job_id,
+            event_id=event_id,
+            format=export_format,
+            data_version=data_version,
+            created_at=datetime.now(),
+        )
+        if get_artifact(event_id, export_format, data_version) is not None:
+            job.status = ExportJobStatusEnum.done
+            job.finished_at = job.created_at
+            _jobs[job_id] = job
+            return job
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        future = _get_executor().submit(build_artifact, event_id, export_format, str(path))
+        _jobs[job_id] = job
+    future.add_done_callback(lambda future: _finish(job, future))
+    return job
+
+
+def get_job(job_id: str) -> ExportJob | None:
+    """Returns job of this process or finished job of any process"""
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return job
+
+    parsed = _parse_job_id(job_id)
+    if parsed is None:
+        return None
+    path = _artifact_path(*parsed)
+    try:
+        finished_at = datetime.fromtimestamp(path.stat().st_mtime)
+    except FileNotFoundError:
+        return None
+    event_id, export_format, data_version = parsed
+    return ExportJob(
+        id=job_id,
+        event_id=event_id,
+        format=export_format,
+        data_version=data_version,
+        status=ExportJobStatusEnum.done,
+        created_at=finished_at,
+        finished_at=finished_at,
+    )
+
+
+def get_job_artifact(job: ExportJob) -> Path | None:
+    """Returns file of the finished job, None when it was evicted"""
+    return get_artifact(job.event_id, job.format, job.data_version)
+
+
+def _remove_stale_artifacts(job: ExportJob):
+    """Files of older data versions are never used again"""
+    current = _artifact_path(job.event_id, job.format, job.data_version)
+    pattern = f"event-{job.event_id}-{job.format.value}-*.{EXTENSIONS[job.format]}"
+    for path in current.parent.glob(pattern):
+        if path != current:
+            path.unlink(missing_ok=True)
+
+
+def evict():
+    """
+    Removes files older than maximal age, then the least recently used
+    files until their total size is under the limit. Forgets old jobs.
+    """
+    directory = Path(settings.export_cache_location)
+    max_age = settings.export_cache_max_age_minutes * 60
+    now = time()
+
+    files = []
+    for path in directory.glob("event-*"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if now - stat.st_mtime > max_age:
+            path.unlink(missing_ok=True)
+        elif not path.name.endswith(".tmp"):
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= settings.export_cache_max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+    expired = datetime.now() - timedelta(seconds=max_age)
+    with _lock:
+        for job_id in [
+            job_id for job_id, job in _jobs.items()
+            if job.status != ExportJobStatusEnum.pending and job.created_at < expired
+        ]:
+            del _jobs[job_id]
@@ -0,0 +1,168 @@
+"""Module for safe retries of requests with `Idempotency-Key` header"""
+from datetime import datetime, timedelta
+from hashlib import sha256
+from time import monotonic, sleep
+from typing import Any, Callable
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import models
+from app.schemas.settings import settings
+
+
+def _request_hash(payload: BaseModel) -> str:
+    return sha256(payload.model_dump_json(exclude_unset=True).encode()).hexdigest()
+
+
+def _replay(status_code: int, content: Any) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content=content,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def _claim(key: str, scope: str, request_hash: str, db: Session) -> bool:
+    """
+    @brief Tries to insert the key, the primary key makes only one request win
+    @return True if this request owns the key, False if it already exists
+    """
+    # Expired key does not block the new request
+    db.execute(delete(models.IdempotencyKey).where(
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.scope == scope,
+        models.IdempotencyKey.expires_at < datetime.now(),
+    ))
+    db.add(models.IdempotencyKey(
+        key=key,
+        scope=scope,
+        request_hash=request_hash,
+        expires_at=datetime.now() + timedelta(
+            minutes=settings.idempotency_key_expire_minutes),
+    ))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return False
+
+
+def _wait_for_first_request(
+    key: str,
+    scope: str,
+    request_hash: str,
+    db: Session,
+) -> JSONResponse | None:
+    """
+    @brief Waits until the request which owns the key stores its response
+    @return Stored response or None if the owner released the key
+    """
+    deadline = monotonic() + settings.idempotency_key_wait_seconds
+    delay = 0.05
+    while True:
+        row = db.execute(select(
+            models.IdempotencyKey.request_hash,
+            models.IdempotencyKey.status_code,
+            models.IdempotencyKey.response,
+        ).where(
+            models.IdempotencyKey.key == key,
+            models.IdempotencyKey.scope == scope,
+        )).first()
+        db.rollback()  # next iteration has to see rows committed meanwhile
+        if row is None:
+            return None
+        if row.request_hash != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail="Idempotency-Key was already used with different request.",
+            )
+        if row.status_code is not None:
+            return _replay(row.status_code, row.response)
+        if monotonic() > deadline:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Request with the same Idempotency-Key is still in progress.",
+            )
+        sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def run_idempotent(
+    key: str | None,
+    scope: str,
+    payload: BaseModel,
+    response_model: Any,
+    handler: Callable[[], Any],
+    db: Session,
+):
+    """
+    @brief Runs handler at most once for the given key and scope
+    @param key value of `Idempotency-Key` header, handler just runs if None
+    @param scope name of the route, the same key can be used on more routes
+    @param payload request body, replay with different body is rejected
+    @param response_model schema used to store the response
+    @param handler function creating the response
+    @param db database session
+    @return Response of the handler or stored response of the first request
+    """
+    if key is None:
+        return handler()
+
+    request_hash = _request_hash(payload)
+    while not _claim(key, scope, request_hash, db):
+        replay = _wait_for_first_request(key, scope, request_hash, db)
+        if replay is not None:
+            return replay
+
+    try:
+        result = handler()
+    except HTTPException as e:
+        if e.status_code >= 500:
+            _release(key, scope, db)
+            raise
+        _store(key, scope, e.status_code, {"detail": e.detail}, db)
+        raise
+    except Exception:
+        _release(key, scope, db)
+        raise
+
+    adapter = TypeAdapter(response_model)
+    content = adapter.dump_python(
+        adapter.validate_python(result, from_attributes=True),
+        mode="json",
+    )
+    _store(key, scope, status.HTTP_200_OK, content, db)
+    return JSONResponse(content=content)
+
+
+def _store(key: str, scope: str, status_code: int, content: Any, db: Session):
+    db.rollback()
+    row = db.get(models.IdempotencyKey, {"key": key, "scope": scope})
+    row.status_code = status_code
+    row.response = content
+    db.commit()
+
+
+def _release(key: str, scope: str, db: Session):
+    db.rollback()
+    db.execute(delete(models.IdempotencyKey).where(
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.scope == scope,
+    ))
+    db.commit()
+
+
+def delete_expired_keys(db: Session) -> int:
+    """
+    @brief Deletes expired idempotency keys
+    @return Count of deleted keys
+    """
+    count = db.execute(delete(models.IdempotencyKey).where(
+        models.IdempotencyKey.expires_at < datetime.now(),
+    )).rowcount
+    db.commit()
+    return count
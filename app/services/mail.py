@@ -1,4 +1,5 @@
 """Module for easy sending emails"""
+import sys
 # Import smtplib for the actual sending function.
 from redmail import EmailSender
 
@@ -28,6 +29,24 @@ def get_mail_client():
     )
 
 
+def send_after_commit(**kwargs) -> bool:
+    """
+    Sends e-mail about already committed change, failure is only logged,
+    so the change is not reported as failed and retried
+    @param kwargs arguments of `EmailSender.send`
+    @return True if the e-mail was sent
+    """
+    try:
+        get_mail_client().send(**kwargs)
+        return True
+    except Exception as e:
+        print(
+            f"Sending e-mail '{kwargs.get('subject')}' to {kwargs.get('receivers')} failed: {e}",
+            file=sys.stderr,
+        )
+        return False
+
+
 if __name__ == "__main__":
     client = get_mail_client()
     client.send(
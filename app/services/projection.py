@@ -0,0 +1,206 @@
+"""
+Module for sparse fieldsets of list endpoints
+
+Rows are loaded by column restricted selects into dictionaries following
+the flat schemas. Related objects are embedded only when requested by
+`expand` and each of them is loaded once per response (or per batch of
+streamed responses).
+"""
+from typing import Annotated, Any, Iterator
+from fastapi import Query
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app import models
+from app.database import SessionLocal
+from app.features.serialization import ORJSONResponse
+from app.schemas.event import EventFlat
+from app.schemas.ticket import TicketFlat
+from app.schemas.ticket_group import TicketGroupFlat
+
+FieldsQuery = Annotated[str | None, Query(
+    description="Comma separated list of returned fields. Response contains flat objects.",
+)]
+ExpandQuery = Annotated[str | None, Query(
+    description="Comma separated list of embedded related objects. Response contains flat objects.",
+)]
+
+TICKET_EXPANDS = {"group", "group.event"}
+# Expansion giving the same objects as `Ticket` schema
+TICKET_FULL_EXPAND = "group.event"
+TICKET_GROUP_EXPANDS = {"event"}
+
+
+def is_requested(fields: str | None, expand: str | None) -> bool:
+    """Flat response is used only when client asks for it"""
+    return fields is not None or expand is not None
+
+
+def _parse_list(value: str | None) -> list[str]:
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _parse_fields(value: str | None, schema: type[BaseModel]) -> list[str]:
+    fields = _parse_list(value) or list(schema.model_fields)
+    unknown = [field for field in fields if field not in schema.model_fields]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}.")
+    return fields
+
+
+def _parse_expand(value: str | None, allowed: set[str]) -> set[str]:
+    expand = set(_parse_list(value))
+    unknown = expand - allowed
+    if unknown:
+        raise ValueError(f"Unknown relations: {', '.join(sorted(unknown))}.")
+    # Nested relation needs its parent
+    for relation in list(expand):
+        expand.add(relation.split(".")[0])
+    return expand
+
+
+def _select_rows(
+    db: Session,
+    model: type[models.BaseModelMixin],
+    fields: list[str],
+    *where: Any,
+    order_by: Any = None,
+    limit: int | None = None,
+) -> list[dict]:
+    stmt = select(*(getattr(model, field) for field in fields)).where(*where)
+    if order_by is not None:
+        stmt = stmt.order_by(order_by)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return [dict(row) for row in db.execute(stmt).mappings()]
+
+
+def _embed(
+    db: Session,
+    rows: list[dict],
+    foreign_key: str,
+    key: str,
+    model: type[models.BaseModelMixin],
+    schema: type[BaseModel],
+    drop_foreign_key: bool = False,
+) -> list[dict]:
+    """
+    @brief Embeds related objects into rows, every object is loaded once
+    @return List of loaded related objects
+    """
+    ids = {row[foreign_key] for row in rows}
+    related = {}
+    if ids:
+        related = {
+            obj["id"]: obj
+            for obj in _select_rows(db, model, list(schema.model_fields), model.id.in_(ids))
+        }
+    for row in rows:
+        row[key] = related.get(row[foreign_key])
+        if drop_foreign_key:
+            del row[foreign_key]
+    return list(related.values())
+
+
+def _parse_ticket_request(fields: str | None, expand: str | None) -> tuple[list[str], set[str], bool]:
+    names = _parse_fields(fields, TicketFlat)
+    relations = _parse_expand(expand, TICKET_EXPANDS)
+
+    # Foreign key is needed for embedding even when it's not requested
+    hidden_group_id = "group" in relations and "group_id" not in names
+    if hidden_group_id:
+        names.append("group_id")
+    return names, relations, hidden_group_id
+
+
+def _embed_ticket_relations(db: Session, rows: list[dict], relations: set[str], hidden_group_id: bool):
+    if "group" in relations:
+        groups = _embed(
+            db, rows, "group_id", "group",
+            models.TicketGroup, TicketGroupFlat, hidden_group_id,
+        )
+        if "group.event" in relations:
+            _embed(db, groups, "event_id", "event", models.Event, EventFlat)
+
+
+def get_tickets(
+    db: Session,
+    fields: str | None,
+    expand: str | None,
+    *where: Any,
+    order_by: Any = None,
+) -> list[dict]:
+    names, relations, hidden_group_id = _parse_ticket_request(fields, expand)
+    rows = _select_rows(db, models.Ticket, names, *where, order_by=order_by)
+    _embed_ticket_relations(db, rows, relations, hidden_group_id)
+    return rows
+
+
+def iter_tickets(
+    fields: str | None,
+    expand: str | None,
+    *where: Any,
+    batch_size: int,
+) -> Iterator[list[dict]]:
+    """
+    @brief Returns tickets ordered by ID in batches, fields like `get_tickets`
+    Fields are checked before the first batch is read. Every batch is one
+    query continuing after ID of the previous batch and related objects
+    are embedded per batch.
+    @return Iterator of lists of rows, it uses its own database session
+    """
+    names, relations, hidden_group_id = _parse_ticket_request(fields, expand)
+    hidden_id = "id" not in names
+    if hidden_id:
+        names.append("id")
+
+    def batches():
+        with SessionLocal() as db:
+            batch_where = where
+            while True:
+                rows = _select_rows(
+                    db, models.Ticket, names, *batch_where,
+                    order_by=models.Ticket.id,
+                    limit=batch_size,
+                )
+                if not rows:
+                    return
+                batch_where = (*where, models.Ticket.id > rows[-1]["id"])
+                _embed_ticket_relations(db, rows, relations, hidden_group_id)
+                if hidden_id:
+                    for row in rows:
+                        del row["id"]
+                yield rows
+                if len(rows) < batch_size:
+                    return
+
+    return batches()
+
+
+def get_ticket_groups(
+    db: Session,
+    fields: str | None,
+    expand: str | None,
+    *where: Any,
+    order_by: Any = None,
+) -> list[dict]:
+    names = _parse_fields(fields, TicketGroupFlat)
+    relations = _parse_expand(expand, TICKET_GROUP_EXPANDS)
+
+    hidden_event_id = "event" in relations and "event_id" not in names
+    if hidden_event_id:
+        names.append("event_id")
+
+    rows = _select_rows(db, models.TicketGroup, names, *where, order_by=order_by)
+    if "event" in relations:
+        _embed(
+            db, rows, "event_id", "event",
+            models.Event, EventFlat, hidden_event_id,
+        )
+    return rows
+
+
+def to_response(rows: list[dict]) -> ORJSONResponse:
+    return ORJSONResponse(content=rows)
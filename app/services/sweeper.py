@@ -0,0 +1,32 @@
+"""Module for periodic cleanup of expired data"""
+import asyncio
+import sys
+from fastapi.concurrency import run_in_threadpool
+from app.database import SessionLocal
+from app.schemas.settings import settings
+from app.services import export_jobs
+from app.services import idempotency as idempotency_service
+from app.services import ticket as ticket_service
+
+
+def sweep():
+    with SessionLocal() as db:
+        ticket_service.cancel_expired_tickets(
+            db,
+            batch_size=settings.hold_sweep_batch_size,
+        )
+        idempotency_service.delete_expired_keys(db)
+    export_jobs.evict()
+
+
+async def run_sweeper():
+    """Runs sweep periodically until the task is cancelled"""
+    while True:
+        await asyncio.sleep(settings.hold_sweep_interval_seconds)
+        try:
+            await run_in_threadpool(sweep)
+        except Exception as e:
+            print(
+                f"Sweeping of expired data failed: {e}",
+                file=sys.stderr,
+            )
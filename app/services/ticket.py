@@ -1,83 +1,137 @@
 """Module for easier ticket management"""
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, select, update
 from app import models
-from app.schemas import ticket, ticket_group, extra
-from datetime import datetime
-import sys
+from app.schemas import ticket, extra
+from datetime import datetime, timedelta
+from collections import Counter
+from app.services import availability
 
 # Here are the email package modules we'll need.
-from .mail import get_default_sender, get_mail_client
+from .mail import get_default_sender, send_after_commit
 
 
-def can_create_ticket_in_ticket_group(
-    group_id: int,
-    db: Session
-):
-    # Get ticket group from database
-    tg: ticket_group.TicketGroup = models.TicketGroup.get_by_id(
-        db_session=db,
-        id=group_id
-    )
+RESERVATION_MESSAGES = {
+    extra.ReservationReasonEnum.missing: "Ticket group is not in database.",
+    extra.ReservationReasonEnum.closed: "Reservations are closed.",
+    extra.ReservationReasonEnum.not_open: "Reservations are not opened yet.",
+    extra.ReservationReasonEnum.full: "Ticket group is already full.",
+}
 
-    # Ticket group is not in database
-    if tg is None:
-        print(
-            "Ticket group is not in database",
-            file=sys.stderr,
-        )
-        return False
-
-    # Prepare event for checks
-    event = models.Event.get_by_id(db_session=db, id=tg.event_id)
-    # Event is not in database
-    if event is None:
-        print(
-            "Event is not in database.",
-            file=sys.stderr
-        )
-        return False
 
-    # Check if it's not end of reservations for the event
-    if event.tickets_sales_end < datetime.now():
-        print(
-            "Reservations are closed.",
-            file=sys.stderr
+class TicketException(Exception):
+    """Error caused by the request, it's answered by 4xx status"""
+
+
+class ReservationException(TicketException):
+    def __init__(self, precheck: extra.ReservationPrecheck):
+        self.precheck = precheck
+        super().__init__(RESERVATION_MESSAGES[precheck.reason])
+
+
+def precheck_ticket_groups(
+    requested: dict[int, int],
+    db: Session,
+) -> dict[int, extra.ReservationPrecheck]:
+    """
+    Checks if the requested count of tickets can be created in ticket groups.
+    Capacity, sales window of the event and count of active tickets are
+    fetched by one aggregate query for all groups.
+    @param requested count of new tickets per ticket group ID
+    @return Result of the check per ticket group ID
+    """
+    rows = db.execute(
+        select(
+            models.TicketGroup.id,
+            models.TicketGroup.capacity,
+            models.TicketGroup.event_id,
+            models.Event.tickets_sales_start,
+            models.Event.tickets_sales_end,
+            models.Event.hold_duration_minutes,
+            func.count(models.Ticket.id).label("active"),
+        ).join(
+            models.Event,
+            models.Event.id == models.TicketGroup.event_id,
+        ).outerjoin(
+            models.Ticket,
+            (models.Ticket.group_id == models.TicketGroup.id)
+            & (models.Ticket.status != models.TicketStatusEnum.cancelled),
+        ).where(
+            models.TicketGroup.id.in_(requested.keys())
+        ).group_by(
+            models.TicketGroup.id,
+            models.TicketGroup.capacity,
+            models.TicketGroup.event_id,
+            models.Event.tickets_sales_start,
+            models.Event.tickets_sales_end,
+            models.Event.hold_duration_minutes,
         )
-        return False
+    ).all()
 
-    # Check if reservations started for the event
-    if event.tickets_sales_start > datetime.now():
-        print(
-            "Reservations are not opened yet.",
-            file=sys.stderr
+    now = datetime.now()
+    prechecks = {
+        group_id: extra.ReservationPrecheck(
+            group_id=group_id,
+            reason=extra.ReservationReasonEnum.missing,
         )
-        return False
-
-    # Check if there is place for the ticket in ticket group
-    count_of_tickets_in_tg = db.query(
-        func.count(models.Ticket.id)
-    ).filter(
-        models.Ticket.group_id == group_id
-    ).filter(
-        models.Ticket.status != models.TicketStatusEnum.cancelled
-    ).scalar()
-    if count_of_tickets_in_tg >= tg.capacity:
-        print(
-            "Ticket group is already full.",
-            file=sys.stderr
+        for group_id in requested
+    }
+    for row in rows:
+        if row.tickets_sales_end < now:
+            reason = extra.ReservationReasonEnum.closed
+        elif row.tickets_sales_start > now:
+            reason = extra.ReservationReasonEnum.not_open
+        elif row.active + requested[row.id] > row.capacity:
+            reason = extra.ReservationReasonEnum.full
+        else:
+            reason = extra.ReservationReasonEnum.ok
+        prechecks[row.id] = extra.ReservationPrecheck(
+            group_id=row.id,
+            reason=reason,
+            event_id=row.event_id,
+            capacity=row.capacity,
+            active=row.active,
+            hold_duration_minutes=row.hold_duration_minutes,
         )
-        return False
-    return True
+    return prechecks
+
+
+def precheck_ticket_group(
+    group_id: int,
+    db: Session,
+    count: int = 1,
+) -> extra.ReservationPrecheck:
+    return precheck_ticket_groups({group_id: count}, db)[group_id]
+
+
+def can_create_ticket_in_ticket_group(
+    group_id: int,
+    db: Session
+) -> bool:
+    return precheck_ticket_group(group_id, db).reason == extra.ReservationReasonEnum.ok
+
+
+def get_hold_until(
+    hold_duration_minutes: int | None,
+    order_date: datetime,
+) -> datetime | None:
+    if hold_duration_minutes is None:
+        return None
+    return order_date + timedelta(minutes=hold_duration_minutes)
 
 
 def create_ticket(
     t: ticket.TicketCreate,
     db: Session,
     send_mail: bool = True,
+    hold_until: datetime | None = None,
 ):
     # Write ticket to database
-    t_db: ticket.Ticket = models.Ticket.create(db_session=db, **t.model_dump())
+    t_db: ticket.Ticket = models.Ticket.create(
+        db_session=db,
+        **t.model_dump(),
+        hold_until=hold_until,
+    )
 
     # Prepare SMTP sender address
     smtp_sender = t_db.group.event.smtp_mail_from or get_default_sender()
@@ -87,8 +141,7 @@ def create_ticket(
         return t_db
 
     # Send the email via SMTP server
-    smtp_client = get_mail_client()
-    smtp_client.send(
+    send_after_commit(
         subject="Vaše rezervace vstupenky 🎫",
         sender=smtp_sender,
         receivers=[t_db.email],
@@ -107,50 +160,153 @@ def create_ticket_easily(
     db: Session
 ):
     if "@" not in t.email:
-        return None
+        raise TicketException("Wrong e-mail.")
 
     # Check if they can create ticket
-    if not can_create_ticket_in_ticket_group(t.group_id, db=db):
-        return None
+    precheck = precheck_ticket_group(t.group_id, db=db)
+    if precheck.reason != extra.ReservationReasonEnum.ok:
+        raise ReservationException(precheck)
 
     # Prevent random clients create (for example) paid tickets
     t.status = models.TicketStatusEnum.new
     t.order_date = datetime.now()
-    return create_ticket(t, db)
+    return create_ticket(
+        t,
+        db,
+        # Unpaid ticket holds the position only for limited time
+        hold_until=get_hold_until(
+            precheck.hold_duration_minutes, t.order_date),
+    )
 
 
-def cancel_ticket(
-    ct: extra.CancelTicket,
-    t: ticket.Ticket,
-    db: Session
+def create_ticket_order(
+    order: ticket.TicketOrder,
+    db: Session,
+    send_mail: bool = True,
 ):
-    if ct.id != t.id:
-        raise Exception("Wrong ID.")
-    if ct.email != t.email:
-        raise Exception("Wrong e-mail.")
-
-    # Updated ticket
-    ut = ticket.TicketPatch(
-        firstname=t.firstname,
-        lastname=t.lastname,
-        email=t.email,
-        description=t.description,
-        status=models.TicketStatusEnum.cancelled,
-        group_id=t.group_id
+    """
+    Creates all tickets of the order in one transaction.
+    Capacity of every ticket group is checked before anything is written,
+    so the order is either created as a whole or not at all.
+    """
+    if "@" not in order.email:
+        raise TicketException("Wrong e-mail.")
+    for item in order.tickets:
+        if item.email is not None and "@" not in item.email:
+            raise TicketException(f"Wrong e-mail of ticket for {item.firstname} {item.lastname}.")
+    if len(order.tickets) == 0:
+        raise TicketException("Order does not contain any ticket.")
+
+    # Count requested positions per ticket group
+    requested = Counter(item.group_id for item in order.tickets)
+
+    # Lock requested ticket groups until commit (SQLite ignores FOR UPDATE)
+    db.execute(
+        select(models.TicketGroup.id).where(
+            models.TicketGroup.id.in_(requested.keys())
+        ).with_for_update()
     )
-    t_db = models.Ticket.update(
-        db_session=db,
-        id=ct.id,
-        **ut.model_dump()
+
+    prechecks = precheck_ticket_groups(requested, db)
+    for precheck in prechecks.values():
+        if precheck.reason != extra.ReservationReasonEnum.ok:
+            raise ReservationException(precheck)
+
+    # All tickets of the order must be for the same event
+    event_ids = {precheck.event_id for precheck in prechecks.values()}
+    if len(event_ids) != 1:
+        raise TicketException("All tickets of the order must be for the same event.")
+
+    # Write all tickets in one transaction
+    now = datetime.now()
+    tickets = [
+        models.Ticket(
+            email=item.email or order.email,
+            firstname=item.firstname,
+            lastname=item.lastname,
+            description=item.description,
+            group_id=item.group_id,
+            status=models.TicketStatusEnum.new,
+            order_date=now,
+            hold_until=get_hold_until(
+                prechecks[item.group_id].hold_duration_minutes, now),
+        )
+        for item in order.tickets
+    ]
+    db.add_all(tickets)
+    db.commit()
+
+    if not send_mail:
+        return tickets
+
+    # Send one confirmation for the whole order
+    event = tickets[0].group.event
+    send_after_commit(
+        subject="Vaše rezervace vstupenek 🎫",
+        sender=event.smtp_mail_from or get_default_sender(),
+        receivers=[order.email],
+        text=event.mail_text_new_ticket,
+        html=event.mail_html_new_ticket,
+        # https://red-mail.readthedocs.io/en/stable/tutorials/jinja_support.html
+        body_params={
+            "ticket": tickets[0],
+            "tickets": tickets,
+        },
     )
+    return tickets
+
+
+def cancel_ticket(
+    ct: extra.CancelTicket,
+    db: Session
+) -> models.Ticket | None:
+    """
+    Cancels the ticket when its e-mail matches by one conditional UPDATE,
+    so from concurrent requests only one cancels the ticket and sends mail.
+    @return Cancelled ticket with group and event, None if it does not exist
+    """
+    cancelled = db.execute(
+        update(models.Ticket).where(
+            models.Ticket.id == ct.id,
+            models.Ticket.email == ct.email,
+            models.Ticket.status != models.TicketStatusEnum.cancelled,
+        ).values(
+            status=models.TicketStatusEnum.cancelled,
+            version=models.Ticket.version + 1,
+            updated_at=datetime.now(),
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+
+    if cancelled == 0:
+        db.rollback()
+        current = db.execute(
+            select(models.Ticket.email, models.Ticket.status).where(
+                models.Ticket.id == ct.id)
+        ).one_or_none()
+        if current is None:
+            return None
+        if current.email != ct.email:
+            raise TicketException("Wrong e-mail.")
+        raise TicketException("Ticket is already cancelled.")
+
+    # Ticket with group and event including mail templates in one query
+    t_db = db.scalars(
+        select(models.Ticket).where(
+            models.Ticket.id == ct.id
+        ).options(
+            joinedload(models.Ticket.group)
+            .joinedload(models.TicketGroup.event)
+            .undefer_group("mail_templates")
+        ).execution_options(populate_existing=True)
+    ).one()
+    availability.mark_groups_changed(db, {t_db.group_id})
+    db.commit()
 
-    # TODO: Send e-mail to user.
     # Prepare SMTP sender address
     smtp_sender = t_db.group.event.smtp_mail_from or get_default_sender()
 
     # Send the email via SMTP server
-    smtp_client = get_mail_client()
-    smtp_client.send(
+    send_after_commit(
         subject="Vaše stornovaná rezervace vstupenky ❌🎫❌",
         sender=smtp_sender,
         receivers=[t_db.email],
@@ -172,3 +328,45 @@ def get_tickets_by_event_id(
     return db.query(models.Ticket).join(models.TicketGroup).filter(
         models.TicketGroup.event_id == event_id
     ).order_by(models.Ticket.email).all()
+
+
+def cancel_expired_tickets(
+    db: Session,
+    batch_size: int = 500,
+) -> int:
+    """
+    Cancels new tickets whose hold expired, so their positions are free again.
+    Tickets are cancelled in batches to keep the write transactions short.
+    @return Count of cancelled tickets
+    """
+    cancelled = 0
+    while True:
+        now = datetime.now()
+        expired = (
+            models.Ticket.status == models.TicketStatusEnum.new,
+            models.Ticket.hold_until < now,
+        )
+        rows = db.execute(
+            select(models.Ticket.id, models.Ticket.group_id).where(
+                *expired
+            ).limit(batch_size)
+        ).all()
+        if len(rows) == 0:
+            break
+        ids = [row.id for row in rows]
+        availability.mark_groups_changed(db, {row.group_id for row in rows})
+
+        cancelled += db.execute(
+            update(models.Ticket).where(
+                models.Ticket.id.in_(ids),
+                *expired,
+            ).values(
+                status=models.TicketStatusEnum.cancelled,
+                version=models.Ticket.version + 1,
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+
+        if len(ids) < batch_size:
+            break
+    return cancelled
@@ -1,22 +1,67 @@
 """Module for easier ticket groups management"""
-from app.schemas import extra, ticket
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+from app import models
+from app.schemas import event, ticket, ticket_group
 
 
-def get_ticket_groups_with_capacity(tgs: list[extra.TicketGroupExtra]):
-    for tg in tgs:
-        tg.free_positions = 0
-        tg.paid = 0
-        tg.cancelled = 0
-        for t in tg.tickets:
-            if t.status in [
-                ticket.TicketStatusEnum.new,
-                ticket.TicketStatusEnum.confirmed,
-                ticket.TicketStatusEnum.paid
-            ]:
-                tg.paid += 1
-            elif t.status == ticket.TicketStatusEnum.cancelled:
-                tg.cancelled += 1
-        free_positions = tg.capacity - tg.paid
-        if free_positions > 0:
-            tg.free_positions = free_positions
-    return tgs
+def get_ticket_groups_with_capacity(
+    e: models.Event,
+    db: Session,
+) -> list[ticket_group.TicketGroupWithCapacity]:
+    """
+    Returns ticket groups of the event with counts of tickets.
+    Tickets are counted in the database, the event is serialized only once
+    and shared by all groups.
+    """
+    rows = db.execute(
+        select(
+            models.TicketGroup.id,
+            models.TicketGroup.name,
+            models.TicketGroup.capacity,
+            models.TicketGroup.event_id,
+            models.TicketGroup.version,
+            models.TicketGroup.updated_at,
+            func.count(case((
+                models.Ticket.status.in_([
+                    ticket.TicketStatusEnum.new,
+                    ticket.TicketStatusEnum.confirmed,
+                    ticket.TicketStatusEnum.paid,
+                ]),
+                models.Ticket.id,
+            ))).label("paid"),
+            func.count(case((
+                models.Ticket.status == ticket.TicketStatusEnum.cancelled,
+                models.Ticket.id,
+            ))).label("cancelled"),
+        ).outerjoin(
+            models.Ticket,
+            models.Ticket.group_id == models.TicketGroup.id,
+        ).where(
+            models.TicketGroup.event_id == e.id
+        ).group_by(
+            models.TicketGroup.id,
+            models.TicketGroup.name,
+            models.TicketGroup.capacity,
+            models.TicketGroup.event_id,
+            models.TicketGroup.version,
+            models.TicketGroup.updated_at,
+        ).order_by(models.TicketGroup.id)
+    ).all()
+
+    event_schema = event.Event.model_validate(e)
+    return [
+        ticket_group.TicketGroupWithCapacity(
+            id=row.id,
+            name=row.name,
+            capacity=row.capacity,
+            event_id=row.event_id,
+            version=row.version,
+            updated_at=row.updated_at,
+            event=event_schema,
+            paid=row.paid,
+            cancelled=row.cancelled,
+            free_positions=max(row.capacity - row.paid, 0),
+        )
+        for row in rows
+    ]
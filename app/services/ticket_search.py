@@ -0,0 +1,95 @@
+"""
+Module for full-text search of tickets
+
+Tickets are searched by words of e-mail, names and description, every
+word of the query matches words starting with it. SQLite uses FTS5 table
+`tickets_fts` kept in sync by triggers, MariaDB (MySQL) uses FULLTEXT
+index `ix_tickets_search`. The index drives the query, filters are checked
+for its matches and all matches are ranked in the same query.
+"""
+import re
+from sqlalchemy import Select, and_, column, exists, literal_column, or_, select, table
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.orm import Session
+from app.models import Ticket, TicketGroup, TicketStatusEnum
+
+tickets_fts = table("tickets_fts", column("rowid"), column("rank"))
+
+
+def parse_query(query: str) -> list[str]:
+    """Splits the query to words, other characters are not part of the index"""
+    words = re.findall(r"\w+", query)
+    if not words:
+        raise ValueError("Search query has no words.")
+    return words
+
+
+def _select_sqlite(words: list[str], filters: list) -> Select:
+    # Quoted words are not parsed as FTS5 operators, `*` matches prefixes
+    fts_query = " AND ".join(f'"{word}"*' for word in words)
+    stmt = select(
+        tickets_fts.c.rowid.label("id"),
+        tickets_fts.c.rank.label("score"),  # lower is better
+    ).where(literal_column("tickets_fts").op("MATCH")(fts_query))
+    if filters:
+        # Correlated subquery keeps the full-text table in the outer loop
+        stmt = stmt.where(exists().where(Ticket.id == tickets_fts.c.rowid, *filters))
+    return stmt
+
+
+def _select_mysql(words: list[str], filters: list) -> Select:
+    score = match(
+        Ticket.email, Ticket.firstname, Ticket.lastname, Ticket.description,
+        against=" ".join(f"+{word}*" for word in words),
+    ).in_boolean_mode()
+    return select(Ticket.id, (-score).label("score")).where(score, *filters)
+
+
+def _select_like(words: list[str], filters: list) -> Select:
+    """Prefix search for databases without supported full-text index"""
+    return select(Ticket.id, Ticket.lastname.label("score")).where(and_(*(
+        or_(
+            Ticket.email.istartswith(word, autoescape=True),
+            Ticket.firstname.istartswith(word, autoescape=True),
+            Ticket.lastname.istartswith(word, autoescape=True),
+            Ticket.description.istartswith(word, autoescape=True),
+        )
+        for word in words
+    )), *filters)
+
+
+def search_ticket_ids(
+    db: Session,
+    query: str,
+    event_id: int | None = None,
+    statuses: list[TicketStatusEnum] | None = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> list[int]:
+    """
+    @brief Searches tickets by the query
+    @param query words searched in e-mail, names and description
+    @param event_id search only tickets of the event
+    @param statuses search only tickets with these statuses
+    @return IDs of the page of tickets ordered by relevance
+    """
+    words = parse_query(query)
+    filters = []
+    if event_id is not None:
+        filters.append(Ticket.group_id.in_(
+            select(TicketGroup.id).where(TicketGroup.event_id == event_id)))
+    if statuses:
+        filters.append(Ticket.status.in_(statuses))
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        stmt = _select_sqlite(words, filters)
+    elif dialect in ("mysql", "mariadb"):
+        stmt = _select_mysql(words, filters)
+    else:
+        stmt = _select_like(words, filters)
+
+    # Every match is ranked, the database keeps only the best offset+limit
+    return list(db.scalars(
+        stmt.order_by("score", "id").limit(limit).offset(offset)
+    ))
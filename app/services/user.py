@@ -1,9 +1,18 @@
+from datetime import datetime
+from typing import Iterator
 from uuid import UUID
-from sqlalchemy.orm import Session
+import sqlalchemy as sa
+from sqlalchemy import BINARY, insert, literal, select
+from sqlalchemy.orm import Session, selectinload
 
 from app import models
-from app.schemas.user import UserFromDB, UserInDB, UserRegister
-from app.schemas.user_favorite_events import UserFavoriteEvent
+from app.database import SessionLocal
+from app.schemas.user import AuthPrincipal, UserFromDB, UserInDB, UserRegister
+from app.schemas.user_favorite_events import (
+    UserFavoriteEvent,
+    UserFavoriteEventsPatch,
+    UserFavoriteEventsPatchResult,
+)
 from app.services.auth import get_password_hash
 
 
@@ -35,6 +44,13 @@ def get_all(db: Session) -> list[UserFromDB]:
     return models.User.get_all(db_session=db)
 
 
+def iter_all(batch_size: int) -> Iterator[list[UserFromDB]]:
+    """Yields batches of all users with favorite events, it uses its own session"""
+    with SessionLocal() as db:
+        yield from models.User.iter_batches(
+            db, batch_size, selectinload(models.User.favorite_events))
+
+
 def get_by_id(user_id: UUID, db: Session) -> UserFromDB | None:
     return models.User.get_by_id(db_session=db, id=user_id.bytes)
 
@@ -47,6 +63,21 @@ def get_by_username(username: str, db: Session) -> UserFromDB | None:
     )
 
 
+def get_principal(username: str, db: Session) -> AuthPrincipal | None:
+    """Reads only columns needed for authorization, nothing is loaded to the session"""
+    row = db.execute(
+        select(
+            models.User.uuid,
+            models.User.username,
+            models.User.scopes,
+            models.User.disabled,
+        ).where(models.User.username == username)
+    ).one_or_none()
+    if row is None:
+        return None
+    return AuthPrincipal.model_validate(row)
+
+
 def update(model: UserInDB, db: Session) -> UserFromDB | None:
     return models.User.update(
         db_session=db, id=model.uuid, **model.model_dump()
@@ -58,35 +89,77 @@ def delete(user_id: UUID, db: Session) -> bool:
     return not not user
 
 
-def get_favorite_events(user: UserFromDB, db: Session) -> list[UserFavoriteEvent]:
+def get_favorite_events(user: AuthPrincipal, db: Session) -> list[UserFavoriteEvent]:
     return db.query(models.Event).join(
         models.user_favorite_events,
         models.Event.id == models.user_favorite_events.c.event_id
     ).filter(
-        models.user_favorite_events.c.user_uuid == user.uuid
+        models.user_favorite_events.c.user_uuid == user.uuid.bytes
     ).order_by(models.Event.tickets_sales_end).all()
 
 
-def add_favorite_event(user: UserFromDB, event_id: int, db: Session) -> UserFavoriteEvent:
-    event = db.get(models.Event, event_id)
-    if event is None:
-        raise ValueError(f"Event with ID '{event_id}' not found")
+def _touch(user_uuid: bytes, db: Session):
+    """Favorites are part of the user, its version has to change"""
+    db.execute(
+        sa.update(models.User).where(
+            models.User.uuid == user_uuid
+        ).values(
+            updated_at=datetime.now(),
+            version=models.User.version + 1,
+        ).execution_options(synchronize_session=False)
+    )
 
-    # Do not add duplicate
-    if event not in user.favorite_events:
-        user.favorite_events.append(event)
-        db.commit()
-    else:
-        raise Exception("Favorite event already exists")
 
+def _insert_favorites(user_uuid: bytes, event_ids: list[int], db: Session) -> int:
+    """
+    Adds existing events from the list to favorites by one INSERT ... SELECT,
+    already favorite events are skipped by the database
+    @return Count of added events
+    """
+    favorites = models.user_favorite_events
+    stmt = insert(favorites).from_select(
+        [favorites.c.user_uuid, favorites.c.event_id],
+        select(
+            literal(user_uuid, BINARY(16)), models.Event.id
+        ).where(models.Event.id.in_(event_ids)),
+    ).prefix_with(
+        "OR IGNORE", dialect="sqlite"
+    ).prefix_with(
+        "IGNORE", dialect="mysql"
+    ).prefix_with(
+        "IGNORE", dialect="mariadb"
+    )
+    return db.execute(stmt).rowcount
 
-def delete_favorite_event(user: UserFromDB, event_id: int, db: Session) -> bool:
-    ct_db = db.execute(
+
+def _delete_favorites(user_uuid: bytes, event_ids: list[int], db: Session) -> int:
+    """@return Count of removed events"""
+    return db.execute(
         models.user_favorite_events.delete().where(
-            models.user_favorite_events.c.user_uuid == user.uuid,
-            models.user_favorite_events.c.event_id == event_id
+            models.user_favorite_events.c.user_uuid == user_uuid,
+            models.user_favorite_events.c.event_id.in_(event_ids)
         )
     ).rowcount
+
+
+def add_favorite_event(user: AuthPrincipal, event_id: int, db: Session):
+    added = _insert_favorites(user.uuid.bytes, [event_id], db)
+    if added > 0:
+        _touch(user.uuid.bytes, db)
+        db.commit()
+        return
+
+    # Nothing was added, find out why
+    db.rollback()
+    if db.scalar(select(models.Event.id).where(models.Event.id == event_id)) is None:
+        raise ValueError(f"Event with ID '{event_id}' not found")
+    raise Exception("Favorite event already exists")
+
+
+def delete_favorite_event(user: AuthPrincipal, event_id: int, db: Session) -> bool:
+    ct_db = _delete_favorites(user.uuid.bytes, [event_id], db)
+    if ct_db > 0:
+        _touch(user.uuid.bytes, db)
     db.commit()
     if ct_db == 0:
         raise Exception(
@@ -98,3 +171,35 @@ def delete_favorite_event(user: UserFromDB, event_id: int, db: Session) -> bool:
     raise Exception(
         "Database integrity error.",
     )
+
+
+def patch_favorite_events(
+    user: AuthPrincipal,
+    patch: UserFavoriteEventsPatch,
+    db: Session
+) -> UserFavoriteEventsPatchResult:
+    """
+    @brief Adds and removes favorite events in one transaction
+    @param patch IDs of events to add and to remove, events already in
+                 the wanted state are skipped
+    @return Counts of really added and removed events, ValueError is raised
+            for unknown events before anything is changed
+    """
+    add, remove = set(patch.add), set(patch.remove)
+    if add & remove:
+        raise ValueError(
+            f"Events can't be added and removed at once: {', '.join(map(str, sorted(add & remove)))}.")
+    if add:
+        missing = add - set(db.scalars(
+            select(models.Event.id).where(models.Event.id.in_(add))))
+        if missing:
+            raise ValueError(f"Events not found: {', '.join(map(str, sorted(missing)))}.")
+
+    result = UserFavoriteEventsPatchResult(
+        added=_insert_favorites(user.uuid.bytes, sorted(add), db) if add else 0,
+        removed=_delete_favorites(user.uuid.bytes, sorted(remove), db) if remove else 0,
+    )
+    if result.added or result.removed:
+        _touch(user.uuid.bytes, db)
+    db.commit()
+    return result
@@ -0,0 +1,164 @@
+"""
+Module for bulk provisioning of users
+
+Imported rows are validated first, usernames are checked against the
+database by one IN query and passwords of new users are hashed by a pool
+of threads (argon2 releases the GIL while hashing). New users are inserted
+by one statement in one transaction, so the import is all or nothing for
+valid rows and every row gets its own result.
+"""
+import csv
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from uuid import UUID
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import models
+from app.middleware.auth import get_unknown_scopes
+from app.schemas.settings import settings
+from app.schemas.user import UserLogin
+from app.schemas.user_bulk import (
+    UserImportResult,
+    UserImportStatusEnum,
+    UserScopesPatch,
+    UserScopesResult,
+    UserScopesStatusEnum,
+)
+from app.services.auth import get_password_hash
+
+IMPORT_MAX_ROWS = 1000
+
+
+def parse_csv(text: str) -> list[dict[str, Any]]:
+    """
+    Columns are named by fields of `UserLogin`, scopes are separated by
+    spaces and empty `disabled` cells mean not disabled
+    """
+    rows = []
+    for row in csv.DictReader(io.StringIO(text)):
+        values = {
+            key.strip(): value.strip()
+            for key, value in row.items()
+            if key and isinstance(value, str)
+        }
+        if "scopes" in values:
+            values["scopes"] = values["scopes"].split()
+        if values.get("disabled") == "":
+            del values["disabled"]
+        rows.append(values)
+    return rows
+
+
+def _format_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()
+    )
+
+
+def import_users(rows: list[Any], db: Session) -> list[UserImportResult]:
+    """
+    @brief Creates users from rows with fields of `UserLogin`
+    @param rows parsed JSON objects or CSV rows
+    @return Result of every row in the given order, ValueError is raised
+            for too many rows
+    """
+    if len(rows) > IMPORT_MAX_ROWS:
+        raise ValueError(f"At most {IMPORT_MAX_ROWS} users can be imported at once.")
+
+    results = []
+    new: dict[str, tuple[UserImportResult, UserLogin]] = {}
+    for number, values in enumerate(rows, 1):
+        try:
+            user = UserLogin.model_validate(values)
+        except ValidationError as e:
+            results.append(UserImportResult(
+                row=number,
+                username=values.get("username") if isinstance(values, dict) else None,
+                status=UserImportStatusEnum.invalid,
+                error=_format_error(e),
+            ))
+            continue
+        result = UserImportResult(
+            row=number, username=user.username, status=UserImportStatusEnum.created)
+        results.append(result)
+        unknown_scopes = get_unknown_scopes(user.scopes)
+        if len(user.username) == 0 or len(user.plaintext_password) == 0:
+            result.status = UserImportStatusEnum.invalid
+            result.error = "Username and password cannot be empty"
+        elif unknown_scopes:
+            result.status = UserImportStatusEnum.invalid
+            result.error = f"Unknown scopes: {', '.join(unknown_scopes)}."
+        elif user.username in new:
+            result.status = UserImportStatusEnum.duplicate
+            result.error = f"Username is already imported by row {new[user.username][0].row}"
+        else:
+            new[user.username] = (result, user)
+
+    if new:
+        for username in db.scalars(
+            select(models.User.username).where(models.User.username.in_(new))
+        ):
+            result, _ = new.pop(username)
+            result.status = UserImportStatusEnum.duplicate
+            result.error = "Username already registered"
+    if not new:
+        return results
+
+    with ThreadPoolExecutor(max_workers=settings.password_hash_workers) as pool:
+        hashes = pool.map(
+            get_password_hash, [user.plaintext_password for _, user in new.values()])
+    users = []
+    for (result, user), hashed_password in zip(new.values(), hashes):
+        uuid = models.generate_uuid()
+        result.uuid = UUID(bytes=uuid)
+        users.append({
+            **user.model_dump(exclude={"plaintext_password"}),
+            "uuid": uuid,
+            "hashed_password": hashed_password,
+        })
+    try:
+        db.execute(insert(models.User), users)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise Exception("Some usernames were registered meanwhile, nothing was imported.")
+    return results
+
+
+def patch_scopes(patch: UserScopesPatch, db: Session) -> list[UserScopesResult]:
+    """
+    @brief Grants and revokes scopes of many users in one transaction
+    @return Result of every distinct user in the given order
+    """
+    revoke = set(patch.revoke)
+    if revoke & set(patch.grant):
+        raise ValueError(
+            f"Scopes can't be granted and revoked at once: {', '.join(sorted(revoke & set(patch.grant)))}.")
+
+    uuids = list(dict.fromkeys(patch.uuids))
+    users = {
+        UUID(bytes=user.uuid): user
+        for user in db.scalars(
+            select(models.User).where(models.User.uuid.in_([uuid.bytes for uuid in uuids]))
+        )
+    }
+    results = []
+    for uuid in uuids:
+        user = users.get(uuid)
+        if user is None:
+            results.append(UserScopesResult(uuid=uuid, status=UserScopesStatusEnum.not_found))
+            continue
+        scopes = [scope for scope in user.scopes if scope not in revoke]
+        scopes += [scope for scope in dict.fromkeys(patch.grant) if scope not in scopes]
+        if scopes == user.scopes:
+            status = UserScopesStatusEnum.unchanged
+        else:
+            # JSON column changes only by assignment
+            user.scopes = scopes
+            status = UserScopesStatusEnum.updated
+        results.append(UserScopesResult(uuid=uuid, status=status, scopes=scopes))
+    db.commit()
+    return results
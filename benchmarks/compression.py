@@ -0,0 +1,49 @@
+"""
+Benchmark of CPU cost and saved bytes of response compression
+
+Bodies are ticket lists of different sizes serialized like `GET /tickets/`.
+Levels used by the application are gzip 6 and brotli 4 for responses,
+gzip 9 and brotli 5 for the precompressed catalog.
+
+Run from the repository root with the application environment set:
+`python -m benchmarks.compression`
+"""
+import gzip
+from timeit import repeat
+import brotli
+from app.features.serialization import dump_json
+from app.schemas.ticket import Ticket
+from benchmarks.serialization import make_tickets
+
+LEVELS = {
+    "gzip 1": lambda body: gzip.compress(body, compresslevel=1),
+    "gzip 6": lambda body: gzip.compress(body, compresslevel=6),
+    "gzip 9": lambda body: gzip.compress(body, compresslevel=9),
+    "br 1": lambda body: brotli.compress(body, quality=1),
+    "br 4": lambda body: brotli.compress(body, quality=4),
+    "br 5": lambda body: brotli.compress(body, quality=5),
+    "br 11": lambda body: brotli.compress(body, quality=11),
+}
+
+
+def best_of(func, number: int) -> float:
+    return min(repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    for count in (1, 10, 100, 1_000, 10_000):
+        body = dump_json(list[Ticket], make_tickets(count))
+        number = max(1, 1_000 // count)
+        print(f"{count} tickets, {len(body)} bytes")
+        for name, func in LEVELS.items():
+            size = len(func(body))
+            seconds = best_of(lambda func=func, body=body: func(body), number)
+            print(
+                f"  {name:7} {size:9} bytes {size / len(body):6.1%}"
+                f" {seconds * 1000:9.3f} ms"
+                f" {(len(body) - size) / seconds / 1e6:9.1f} MB saved/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Micro-benchmark of JSON serialization of ticket lists
+
+Compares FastAPI's `response_model` path with the precompiled type adapters
+and orjson responses from `app.features.serialization`. No database is
+needed, tickets are transient ORM objects sharing one group and event.
+Projection rows are dictionaries as loaded by column selects, which is how
+`GET /tickets/` loads full tickets now. The rows are built before timing, so
+their numbers are encoding only, without fetching the rows from the database.
+
+Run from the repository root with the application environment set:
+`python -m benchmarks.serialization [count]`
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from timeit import repeat
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from app import models
+from app.features.serialization import ORJSONResponse, schema_response
+from app.schemas.event import EventFlat
+from app.schemas.ticket import Ticket, TicketFlat
+from app.schemas.ticket_group import TicketGroupFlat
+
+
+def make_tickets(count: int) -> list[models.Ticket]:
+    event = models.Event(
+        id=1,
+        name="Benchmark",
+        tickets_sales_start=datetime(2026, 1, 1),
+        tickets_sales_end=datetime(2026, 12, 31),
+        smtp_mail_from="tickets@example.com",
+        version=1,
+        updated_at=datetime(2026, 1, 1),
+    )
+    group = models.TicketGroup(
+        id=1, name="Standing", capacity=count, event_id=1, event=event,
+        version=1, updated_at=datetime(2026, 1, 1),
+    )
+    return [
+        models.Ticket(
+            id=i,
+            email=f"visitor{i}@example.com",
+            firstname="Jan",
+            lastname=f"Novák {i}",
+            status=models.TicketStatusEnum.paid,
+            description="",
+            order_date=datetime(2026, 3, 1) + timedelta(seconds=i),
+            group_id=1,
+            group=group,
+            version=1,
+            updated_at=datetime(2026, 3, 1) + timedelta(seconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+def best_of(func, number: int = 5) -> float:
+    return min(repeat(func, number=1, repeat=number))
+
+
+def main(count: int):
+    tickets = make_tickets(count)
+    # Rows as loaded by `app.services.projection`, group and event are shared
+    group = TicketGroupFlat.model_validate(tickets[0].group, from_attributes=True)
+    group = {**group.model_dump(), "event": EventFlat.model_validate(
+        tickets[0].group.event, from_attributes=True).model_dump()}
+    rows = [
+        {**TicketFlat.model_validate(t, from_attributes=True).model_dump(), "group": group}
+        for t in tickets
+    ]
+    field = create_model_field(
+        name="Response_read_tickets",
+        type_=list[Ticket],
+        mode="serialization",
+    )
+
+    def fastapi_response_model(dump_json: bool):
+        content = asyncio.run(serialize_response(
+            field=field,
+            response_content=tickets,
+            dump_json=dump_json,
+        ))
+        if dump_json:
+            return content
+        return JSONResponse(content).body
+
+    results = {
+        "response_model, dict + json.dumps": lambda: fastapi_response_model(False),
+        "response_model, dump_json": lambda: fastapi_response_model(True),
+        "schema_response (type adapter)": lambda: schema_response(list[Ticket], tickets).body,
+        "projection rows, jsonable_encoder (encode only)": lambda: JSONResponse(jsonable_encoder(rows)).body,
+        "projection rows, ORJSONResponse (encode only)": lambda: ORJSONResponse(rows).body,
+    }
+    print(f"{count} tickets, best of 5 runs")
+    for name, func in results.items():
+        size = len(func())
+        print(f"{name:48} {best_of(func) * 1000:8.1f} ms {size / 1024:8.0f} KiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
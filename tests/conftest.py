@@ -0,0 +1,32 @@
+import importlib
+import os
+import tempfile
+import pytest
+
+
+def pytest_configure(config):
+    # Settings are read on import of the app, tests use their own SQLite file
+    directory = tempfile.mkdtemp(prefix="cutetix-tests-")
+    os.environ.update(
+        SQLALCHEMY_DATABASE_URL=f"sqlite:///{directory}/test.db",
+        CORS_ORIGINS='["*"]',
+        JWT_SECRET_LOCATION=f"{directory}/private.pem",
+        JWT_PUBLIC_LOCATION=f"{directory}/public.pem",
+        SMTP_FROM="cutetix@example.com",
+        SMTP_HOST="localhost",
+        SMTP_PORT="25",
+        SMTP_USER="cutetix",
+        SMTP_PASSWORD="cutetix",
+        EXPORT_CACHE_LOCATION=f"{directory}/exports",
+    )
+
+
+@pytest.fixture
+def db():
+    # Models are registered on the metadata by their import
+    importlib.import_module("app.models")
+    database = importlib.import_module("app.database")
+    database.BaseModelMixin.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as session:
+        yield session
+    database.BaseModelMixin.metadata.drop_all(bind=database.engine)
@@ -0,0 +1,62 @@
+from datetime import datetime
+from app.models import Event, Ticket, TicketGroup, TicketStatusEnum
+from app.services.export_jobs import get_data_version
+
+
+def create_ticket(db, group: TicketGroup, email: str) -> Ticket:
+    ticket = Ticket(
+        email=email,
+        firstname="Jana",
+        lastname="Nováková",
+        group_id=group.id,
+        order_date=datetime.now(),
+        status=TicketStatusEnum.new,
+    )
+    db.add(ticket)
+    db.commit()
+    return ticket
+
+
+def test_data_version_changes_when_newest_ticket_is_replaced(db):
+    event = Event(
+        name="Ples",
+        tickets_sales_start=datetime(2026, 1, 1),
+        tickets_sales_end=datetime(2027, 1, 1),
+        smtp_mail_from="ples@example.com",
+        mail_text_new_ticket="",
+        mail_html_new_ticket="",
+        mail_text_cancelled_ticket="",
+        mail_html_cancelled_ticket="",
+    )
+    group = TicketGroup(name="Sál", capacity=10, event=event)
+    db.add_all([event, group])
+    db.commit()
+    create_ticket(db, group, "first@example.com")
+    newest = create_ticket(db, group, "deleted@example.com")
+    deleted_id = newest.id
+    before = get_data_version(event.id, db)
+
+    db.delete(newest)
+    db.commit()
+    replacement = create_ticket(db, group, "new@example.com")
+
+    # SQLite gives the new ticket ID of the deleted one
+    assert replacement.id == deleted_id
+    assert get_data_version(event.id, db) != before
+
+
+def test_data_version_is_stable_without_changes(db):
+    event = Event(
+        name="Koncert",
+        tickets_sales_start=datetime(2026, 1, 1),
+        tickets_sales_end=datetime(2027, 1, 1),
+        smtp_mail_from="koncert@example.com",
+        mail_text_new_ticket="",
+        mail_html_new_ticket="",
+        mail_text_cancelled_ticket="",
+        mail_html_cancelled_ticket="",
+    )
+    db.add(event)
+    db.commit()
+
+    assert get_data_version(event.id, db) == get_data_version(event.id, db)
@@ -0,0 +1,55 @@
+from sqlalchemy import select
+from app.models import User
+from app.schemas.user_bulk import UserImportStatusEnum
+from app.services.user_bulk import import_users, parse_csv
+
+
+def make_row(username: str, **values) -> dict:
+    return {
+        "email": f"{username}@example.com",
+        "username": username,
+        "full_name": username.title(),
+        "plaintext_password": "secret",
+        **values,
+    }
+
+
+def test_import_rejects_unknown_scopes(db):
+    results = import_users([
+        make_row("volunteer", scopes=["tickets:read"]),
+        make_row("intruder", scopes=["tickets:read", "root"]),
+    ], db)
+
+    assert [result.status for result in results] == [
+        UserImportStatusEnum.created,
+        UserImportStatusEnum.invalid,
+    ]
+    assert results[1].error == "Unknown scopes: root."
+    assert list(db.scalars(select(User.username))) == ["volunteer"]
+
+
+def test_import_reports_duplicates(db):
+    import_users([make_row("taken")], db)
+
+    results = import_users([make_row("taken"), make_row("fresh"), make_row("fresh")], db)
+
+    assert [result.status for result in results] == [
+        UserImportStatusEnum.duplicate,
+        UserImportStatusEnum.created,
+        UserImportStatusEnum.duplicate,
+    ]
+
+
+def test_parse_csv_splits_scopes():
+    rows = parse_csv(
+        "username,email,full_name,plaintext_password,scopes,disabled\n"
+        "jana,jana@example.com,Jana,secret,events:read tickets:read,\n"
+    )
+
+    assert rows == [{
+        "username": "jana",
+        "email": "jana@example.com",
+        "full_name": "Jana",
+        "plaintext_password": "secret",
+        "scopes": ["events:read", "tickets:read"],
+    }]